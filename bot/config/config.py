@@ -17,6 +17,11 @@ class Settings(BaseSettings):
     SESSIONS_PER_PROXY: int = 1
     USE_PROXY: bool = True
     DISABLE_PROXY_REPLACE: bool = True
+    PROXY_CHECK_CONCURRENCY: int = 20 # Сколько прокси проверять одновременно
+    PROXY_RECHECK_INTERVAL: int = 1800 # Как часто (в секундах) перепроверять все прокси в фоне (0 — не перепроверять)
+    PROXY_PROBE_TARGETS: str = "https://ifconfig.me/ip" # Цели проверки прокси через запятую, пробуются по порядку: http(s)://..., tcp://host:port (только туннель), local (встроенный эхо-сервер)
+    PROXY_PROBE_TIMEOUT: float = 15 # Таймаут одной проверки прокси (в секундах)
+    PROXY_HEALTH_CACHE_TTL: int = 600 # Сколько секунд доверять сохранённому результату проверки прокси (в том числе между запусками)
 
     DEVICE_PARAMS: bool = False
 
@@ -25,12 +30,22 @@ class Settings(BaseSettings):
     AUTO_UPDATE: bool = True
     CHECK_UPDATE_INTERVAL: int = 60
     BLACKLISTED_SESSIONS: str = ""
+    ACCOUNTS_CONFIG_FLUSH_DELAY: float = 1.0 # Сколько секунд копить изменения accounts_config.json перед одной записью на диск
     
     SUBSCRIBE_TELEGRAM: bool = True
+    TG_PERSISTENT_CONNECTION: bool = False # Держать соединение с Telegram открытым между вызовами вместо подключения на каждый
+    TG_IDLE_TIMEOUT: int = 300 # Через сколько секунд простоя закрывать постоянное соединение
+    TG_ARCHIVE_BATCH_SIZE: int = 10 # Сколько новых каналов архивировать одним запросом EditPeerFolders (1 — сразу после подписки)
+    TG_ARCHIVE_BATCH_WINDOW: int = 30 # Сколько секунд копить каналы для архивации: неполная пачка уходит с первым соединением после этого срока (без TG_PERSISTENT_CONNECTION) или по таймеру (с ним)
 
     # Настройки задержки между подписками на каналы
     CHANNEL_SUBSCRIBE_DELAY: int = 20
 
+    # Перепроверка подтверждения подписки на канал (выполняется в фоне, не блокируя обработку других розыгрышей)
+    CHANNEL_VALIDATION_MAX_RETRIES: int = 10 # Сколько раз перепроверять подписку
+    CHANNEL_VALIDATION_MIN_DELAY: int = 360 # Задержка перед первой перепроверкой (в секундах)
+    CHANNEL_VALIDATION_MAX_DELAY: int = 7200 # Задержка перед последней перепроверкой (в секундах)
+
     # Настройки для участия в бесплатных розыгрышах
     PARTICIPATE_IN_FREE_GIVEAWAYS: bool = True
     GIVEAWAY_MIN_PARTICIPANTS: int = 0
@@ -44,15 +59,30 @@ class Settings(BaseSettings):
     # Настройки для получения списка розыгрышей
     GIVEAWAY_LIST_TYPE: str = "Free" # e.g., "Available", "Joined", "Winning", "Free"
     GIVEAWAY_LIST_COUNT: int = 20
-    GIVEAWAY_LIST_CURSOR: str = "" # Оставить пустым для первого запроса
+    GIVEAWAY_LIST_CURSOR: str = "" # Cursor, с которого начинается синхронизация каталога; пустой — с самых новых
+    GIVEAWAY_CATALOG_TTL: int = 600 # Как долго (в секундах) все сессии используют один скачанный каталог розыгрышей
+    GIVEAWAY_CATALOG_FULL_RESYNC_INTERVAL: int = 3600 # Как часто (в секундах) собирать каталог заново вместо инкрементального обновления
 
     # Новая настройка: Максимальное количество розыгрышей для обработки за один проход сессии
     GIVEAWAY_MAX_PER_RUN: int = 100 # Значение по умолчанию, можно настроить
 
+    # Настройки очереди розыгрышей (общей для процессов, работающих с одной channels.db)
+    GIVEAWAY_QUEUE_CLAIM_BATCH_SIZE: int = 5 # Сколько розыгрышей брать в аренду за раз
+    GIVEAWAY_QUEUE_LEASE_SECONDS: int = 1800 # Срок аренды; продлевается, пока розыгрыш обрабатывается
+    GIVEAWAY_QUEUE_MAX_ATTEMPTS: int = 3 # После стольких неудачных попыток розыгрыш уходит в dead_giveaways
+    GIVEAWAY_QUEUE_RETRY_DELAY: int = 600 # Пауза перед повторной попыткой после ошибки (в секундах)
+    GIVEAWAY_CONCURRENCY: int = 3 # Сколько розыгрышей одна сессия обрабатывает одновременно (1 — по одному)
+
         # Настройки для отписки от неактивных каналов
     GIVEAWAY_CHANNEL_INACTIVITY_HOURS: int = 24 # Часов неактивности, после которых канал считается неактивным
     GIVEAWAY_CHANNEL_LEAVE_CHECK_INTERVAL: int = 3600 # Интервал (в секундах) между проверками неактивных каналов
 
+    # Сколько секунд (по auth_date) переиспользовать сохранённые tgWebAppData при авторизации (0 — не кэшировать)
+    INIT_DATA_MAX_AGE: int = 3600
+
+    # За сколько секунд до истечения токена MRKT обновлять его в фоне
+    TOKEN_REFRESH_MARGIN: int = 300
+
     # Настройки для Telegram уведомлений
     NOTIFICATION_BOT_TOKEN: Optional[str] = None
     NOTIFICATION_CHAT_ID: Optional[int] = None
@@ -61,6 +91,19 @@ class Settings(BaseSettings):
 
     # Настройка для срока хранения записей об обработанных розыгрышах (в днях)
     PROCESSED_GIVEAWAYS_DAYS_TO_KEEP: Optional[int] = 3
+    # Максимум обработанных розыгрышей в индексе в памяти (0 — не держать индекс, всегда спрашивать БД)
+    PROCESSED_GIVEAWAYS_INDEX_MAX_SIZE: int = 100000
+
+    # Настройки работы с базой каналов (channels.db)
+    CHANNEL_DB_PERSISTENT_CONNECTION: bool = True # Одно долгоживущее соединение (WAL) на процесс вместо подключения на каждый запрос
+    CHANNEL_DB_BUSY_TIMEOUT_MS: int = 5000 # Сколько ждать снятия блокировки БД другим процессом (в миллисекундах)
+
+    # Общий пул HTTP-соединений (одна сессия aiohttp на пару прокси + хост)
+    HTTP_POOL_LIMIT: int = 100 # Максимум открытых соединений в одной сессии
+    HTTP_POOL_LIMIT_PER_HOST: int = 20 # Максимум соединений с одним хостом
+    HTTP_KEEPALIVE_TIMEOUT: float = 60 # Сколько держать простаивающее соединение открытым (в секундах)
+    HTTP_DNS_CACHE_TTL: int = 600 # Время жизни кэша DNS (в секундах)
+    HTTP_REQUEST_TIMEOUT: float = 60 # Таймаут запроса по умолчанию (в секундах)
 
     # Новая настройка: Отключение отписки от неактивных каналов из БД
     UNSUBSCRIBE_FROM_INACTIVE_CHANNELS: bool = True
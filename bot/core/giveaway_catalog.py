@@ -0,0 +1,158 @@
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+
+from bot.config.config import settings
+from bot.utils import logger
+from bot.utils.channel_repository import ChannelRepository, GiveawayCatalogSnapshot
+
+
+class GiveawayCatalog:
+    """Общий для всех сессий каталог розыгрышей.
+
+    Публичный список розыгрышей одинаков для всех аккаунтов, поэтому его скачивает
+    одна любая рабочая сессия раз в GIVEAWAY_CATALOG_TTL секунд. Снимок хранится в
+    памяти и в channels.db (его видят другие процессы и следующий запуск).
+    """
+
+    def __init__(self, channel_repository: Optional[ChannelRepository] = None, ttl: Optional[float] = None):
+        self._channel_repository = channel_repository or ChannelRepository()
+        self._ttl = settings.GIVEAWAY_CATALOG_TTL if ttl is None else ttl
+        self._bots: List[Any] = []
+        self._snapshots: Dict[str, GiveawayCatalogSnapshot] = {}
+        self._fetch_locks: Dict[str, asyncio.Lock] = {}
+        self._initialized = False
+
+    def register(self, bot: Any) -> None:
+        """Добавляет авторизованный BaseBot в число сессий, через которые можно скачать каталог."""
+        if bot not in self._bots:
+            self._bots.append(bot)
+
+    def unregister(self, bot: Any) -> None:
+        if bot in self._bots:
+            self._bots.remove(bot)
+
+    def _is_fresh(self, snapshot: Optional[GiveawayCatalogSnapshot]) -> bool:
+        return snapshot is not None and time.time() - snapshot.fetched_at < self._ttl
+
+    async def get_items(self, list_type: str, preferred_bot: Any = None) -> List[Dict[str, Any]]:
+        """Возвращает розыгрыши из свежего снимка, при необходимости обновляя его один раз на всех."""
+        snapshot = self._snapshots.get(list_type)
+        if self._is_fresh(snapshot):
+            return snapshot.items
+
+        async with self._fetch_locks.setdefault(list_type, asyncio.Lock()):
+            # Пока ждали, снимок мог обновить кто-то другой
+            snapshot = self._snapshots.get(list_type)
+            if self._is_fresh(snapshot):
+                return snapshot.items
+
+            if not self._initialized:
+                await self._channel_repository.initialize()
+                self._initialized = True
+            stored = await self._channel_repository.get_giveaway_catalog(list_type)
+            if stored is not None and (snapshot is None or stored.fetched_at > snapshot.fetched_at):
+                snapshot = stored
+                self._snapshots[list_type] = stored
+            if self._is_fresh(snapshot):
+                return snapshot.items
+
+            snapshot = await self._fetch(list_type, snapshot, preferred_bot)
+            self._snapshots[list_type] = snapshot
+            await self._channel_repository.save_giveaway_catalog(list_type, snapshot)
+            return snapshot.items
+
+    async def _fetch(
+        self, list_type: str, previous: Optional[GiveawayCatalogSnapshot], preferred_bot: Any
+    ) -> GiveawayCatalogSnapshot:
+        bots = list(self._bots)
+        if preferred_bot is not None:
+            if preferred_bot in bots:
+                bots.remove(preferred_bot)
+            # Своя сессия — последний вариант: если каталог не скачался чужими, ошибку увидит она
+            bots.append(preferred_bot)
+        if not bots:
+            raise RuntimeError("Нет сессий для загрузки каталога розыгрышей")
+
+        last_error: Optional[BaseException] = None
+        for bot in bots:
+            try:
+                return await self._fetch_with(bot, list_type, previous)
+            except Exception as e:
+                last_error = e
+                logger.warning(
+                    f"{getattr(bot._tg_client, 'session_name', 'unknown_session')} | "
+                    f"Не удалось загрузить каталог розыгрышей: {e}"
+                )
+        raise last_error
+
+    async def _fetch_with(
+        self, bot: Any, list_type: str, previous: Optional[GiveawayCatalogSnapshot]
+    ) -> GiveawayCatalogSnapshot:
+        """Постранично скачивает каталог, пока не наберётся GIVEAWAY_MAX_PER_RUN необработанных розыгрышей.
+
+        Список отдаётся от новых к старым, поэтому при инкрементальной синхронизации
+        достаточно листать до самого нового розыгрыша прошлого снимка (newest_id), а
+        остальное взять из него же. Раз в GIVEAWAY_CATALOG_FULL_RESYNC_INTERVAL снимок
+        собирается заново, чтобы из него ушли завершившиеся розыгрыши.
+        """
+        now = time.time()
+        full_sync = (
+            previous is None
+            or previous.newest_id is None
+            or now - previous.full_sync_at >= settings.GIVEAWAY_CATALOG_FULL_RESYNC_INTERVAL
+        )
+        # Известные ID нужны только чтобы не задвоить розыгрыши; остановка — по newest_id
+        known_ids = set() if full_sync else {item["id"] for item in previous.items}
+        stop_id = None if full_sync else previous.newest_id
+
+        max_giveaways = settings.GIVEAWAY_MAX_PER_RUN
+        items: List[Dict[str, Any]] = []
+        seen_ids = set()
+        unprocessed_count = 0
+        cursor = settings.GIVEAWAY_LIST_CURSOR
+        page_count = 0
+
+        while unprocessed_count < max_giveaways:
+            page = await bot.get_giveaways_page(
+                giveaway_type=list_type, count=settings.GIVEAWAY_LIST_COUNT, cursor=cursor
+            )
+            page_count += 1
+            page_items = [item for item in page.get("items", []) if item.get("id")]
+            if not page_items:
+                break
+
+            reached_known = False
+            new_items = []
+            for item in page_items:
+                if item["id"] == stop_id:
+                    reached_known = True
+                    break
+                if item["id"] in seen_ids or item["id"] in known_ids:
+                    continue
+                seen_ids.add(item["id"])
+                new_items.append(item)
+            processed_ids = await self._channel_repository.get_processed_giveaway_ids([item["id"] for item in new_items])
+            unprocessed_count += len(new_items) - len(processed_ids)
+            items.extend(new_items)
+
+            cursor = page.get("nextCursor")
+            if reached_known or not cursor:
+                break
+
+        if not full_sync:
+            items.extend(item for item in previous.items if item["id"] not in seen_ids)
+
+        mode = "полная синхронизация" if full_sync else "инкрементальная синхронизация"
+        bot._log(
+            'info',
+            f'Каталог розыгрышей ({list_type}) обновлён ({mode}): новых {len(seen_ids)}, '
+            f'всего {len(items)}, страниц {page_count}.',
+            'giveaway'
+        )
+        return GiveawayCatalogSnapshot(
+            fetched_at=now,
+            items=items,
+            newest_id=items[0]["id"] if items else None,
+            full_sync_at=now if full_sync else previous.full_sync_at,
+        )
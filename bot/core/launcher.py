@@ -4,8 +4,8 @@ import argparse
 import os
 import subprocess
 import signal
+import time
 from copy import deepcopy
-from random import uniform
 from colorama import init, Fore, Style
 import shutil
 from typing import Optional
@@ -16,6 +16,7 @@ from bot.config import settings
 from bot.core.agents import generate_random_user_agent
 from bot.utils import logger, config_utils, proxy_utils, CONFIG_PATH, SESSIONS_PATH, PROXIES_PATH
 from bot.core.tapper import run_tapper, BaseBot, escape_markdown
+from bot.core.giveaway_catalog import GiveawayCatalog
 from bot.core.registrator import register_sessions
 from bot.utils.updater import UpdateManager
 from bot.exceptions import InvalidSession
@@ -32,6 +33,9 @@ from pyrogram.errors import (
 )
 
 from bot.core.unscribe import ChannelUnsubscriber
+from bot.utils.channel_repository import ChannelRepository
+from bot.utils.http_client import HttpClientRegistry
+from bot.utils.proxy_pool import ProxyPool
 
 init()
 shutdown_event = asyncio.Event()
@@ -219,12 +223,119 @@ def get_sessions(sessions_folder: str) -> list[str]:
     session_names += glob.glob(f"{sessions_folder}/pyrogram/*.session")
     return [file.replace('.session', '') for file in sorted(session_names)]
 
+_SESSION_INIT_ERRORS = (
+    AuthKeyUnregisteredError, AuthKeyDuplicatedError, AuthKeyError,
+    SessionPasswordNeededError, PyrogramAuthKeyUnregisteredError,
+    PyrogramSessionPasswordNeededError, PyrogramSessionRevoked, InvalidSession
+)
+
+
+def _prepare_session(session: str, stored_config: dict) -> tuple[dict, dict]:
+    """Builds the client parameters and the updated config of one session without touching the network."""
+    session_config: dict = deepcopy(stored_config)
+    if 'api' not in session_config:
+        session_config['api'] = {}
+    api_config = session_config.get('api', {})
+    api = None
+    if api_config.get('api_id') in [4, 6, 2040, 10840, 21724]:
+        api = config_utils.get_api(api_config)
+
+    if api:
+        client_params = {
+            "session": session,
+            "api": api
+        }
+    else:
+        client_params = {
+            "api_id": api_config.get("api_id", API_ID),
+            "api_hash": api_config.get("api_hash", API_HASH),
+            "session": session,
+            "lang_code": api_config.get("lang_code", "en"),
+            "system_lang_code": api_config.get("system_lang_code", "en-US")
+        }
+
+        for key in ("device_model", "system_version", "app_version"):
+            if api_config.get(key):
+                client_params[key] = api_config[key]
+
+    session_config['user_agent'] = session_config.get('user_agent', generate_random_user_agent())
+    api_config.update(api_id=client_params.get('api_id') or client_params.get('api').api_id,
+                      api_hash=client_params.get('api_hash') or client_params.get('api').api_hash)
+    return client_params, session_config
+
+
+async def _assign_proxies(prepared: list[tuple[str, dict, dict]], accounts_config: dict) -> list[tuple[str, dict, dict]]:
+    """Sets session_config['proxy'] for every session that needs one; returns the sessions that can start.
+
+    Current proxies are checked together; sessions whose proxy is dead get the best-scored
+    alive proxy of the pool, which checks new proxies only until it has one to give.
+    """
+    pool = ProxyPool.get(PROXIES_PATH)
+    pool.set_usage(accounts_config)
+
+    def assign(session_config: dict, proxy: Optional[str]) -> None:
+        old_proxy = session_config.get('proxy')
+        if old_proxy and proxy != old_proxy:
+            pool.release(old_proxy)
+        session_config['proxy'] = proxy
+
+    ready = []
+    needs_proxy = []
+    for item in prepared:
+        session_config = item[2]
+        session_proxy = session_config.get('proxy')
+        if not session_proxy and 'proxy' in session_config.keys():
+            # Прокси явно отключён для сессии
+            ready.append(item)
+        elif settings.DISABLE_PROXY_REPLACE:
+            proxy = session_proxy or pool.acquire_unchecked()
+            if proxy or not settings.USE_PROXY:
+                session_config['proxy'] = proxy
+                ready.append(item)
+            else:
+                logger.warning(f"{item[0]} | Didn't find a working unused proxy for session | Skipping")
+        elif session_proxy or settings.USE_PROXY:
+            needs_proxy.append(item)
+        else:
+            assign(session_config, None)
+            ready.append(item)
+
+    if not needs_proxy:
+        return ready
+
+    await pool.check(list({item[2]['proxy'] for item in needs_proxy if item[2].get('proxy')}))
+    for item in needs_proxy:
+        session_config = item[2]
+        if session_config.get('proxy') and pool.is_alive(session_config['proxy']):
+            ready.append(item)
+            continue
+        proxy = await pool.acquire_working()
+        if proxy is None:
+            logger.warning(f"{item[0]} | Didn't find a working unused proxy for session | Skipping")
+            continue
+        assign(session_config, proxy)
+        ready.append(item)
+
+    # Сессии запускаются в том же порядке, что и раньше
+    order = {id(item): index for index, item in enumerate(prepared)}
+    ready.sort(key=lambda item: order[id(item)])
+    return ready
+
+
 async def get_tg_clients() -> list[UniversalTelegramClient]:
+    """Creates clients for all sessions: configs are read once, proxies are checked concurrently,
+    and the accounts config is written once at the end."""
     session_paths = get_sessions(SESSIONS_PATH)
 
     if not session_paths:
         raise FileNotFoundError("Session files not found")
-    tg_clients = []
+    accounts_store = config_utils.AccountsConfigStore.get(CONFIG_PATH)
+    # Рабочая копия: в ней копятся назначения прокси, чтобы учитывать их при выборе следующих
+    accounts_config = deepcopy(accounts_store.config)
+    timings = {}
+
+    stage_started = time.monotonic()
+    prepared = []
     for session in session_paths:
         session_name = os.path.basename(session)
 
@@ -232,74 +343,36 @@ async def get_tg_clients() -> list[UniversalTelegramClient]:
             logger.warning(f"{session_name} | Session is blacklisted | Skipping")
             continue
 
-        accounts_config = config_utils.read_config_file(CONFIG_PATH)
-        session_config: dict = deepcopy(accounts_config.get(session_name, {}))
-        if 'api' not in session_config:
-            session_config['api'] = {}
-        api_config = session_config.get('api', {})
-        api = None
-        if api_config.get('api_id') in [4, 6, 2040, 10840, 21724]:
-            api = config_utils.get_api(api_config)
-
-        if api:
-            client_params = {
-                "session": session,
-                "api": api
-            }
-        else:
-            client_params = {
-                "api_id": api_config.get("api_id", API_ID),
-                "api_hash": api_config.get("api_hash", API_HASH),
-                "session": session,
-                "lang_code": api_config.get("lang_code", "en"),
-                "system_lang_code": api_config.get("system_lang_code", "en-US")
-            }
-
-            for key in ("device_model", "system_version", "app_version"):
-                if api_config.get(key):
-                    client_params[key] = api_config[key]
-
-        session_config['user_agent'] = session_config.get('user_agent', generate_random_user_agent())
-        api_config.update(api_id=client_params.get('api_id') or client_params.get('api').api_id,
-                          api_hash=client_params.get('api_hash') or client_params.get('api').api_hash)
+        client_params, session_config = _prepare_session(session, accounts_config.get(session_name, {}))
+        prepared.append((session_name, client_params, session_config))
+    timings['prepare'] = time.monotonic() - stage_started
 
-        session_proxy = session_config.get('proxy')
-        if not session_proxy and 'proxy' in session_config.keys():
-            try:
-                tg_clients.append(UniversalTelegramClient(**client_params))
-                if accounts_config.get(session_name) != session_config:
-                    await config_utils.update_session_config_in_file(session_name, session_config, CONFIG_PATH)
-            except (AuthKeyUnregisteredError, AuthKeyDuplicatedError, AuthKeyError,
-                   SessionPasswordNeededError, PyrogramAuthKeyUnregisteredError,
-                    PyrogramSessionPasswordNeededError,
-                   PyrogramSessionRevoked, InvalidSession) as e:
-                logger.error(f"{session_name} | Session initialization error: {e}")
-                await move_invalid_session_to_error_folder(session_name)
-            continue
-
-        else:
-            if settings.DISABLE_PROXY_REPLACE:
-                proxy = session_proxy or next(iter(proxy_utils.get_unused_proxies(accounts_config, PROXIES_PATH)), None)
-            else:
-                proxy = await proxy_utils.get_working_proxy(accounts_config, session_proxy) \
-                    if session_proxy or settings.USE_PROXY else None
-
-            if not proxy and (settings.USE_PROXY or session_proxy):
-                logger.warning(f"{session_name} | Didn't find a working unused proxy for session | Skipping")
-                continue
-            else:
-                try:
-                    tg_clients.append(UniversalTelegramClient(**client_params))
-                    session_config['proxy'] = proxy
-                    if accounts_config.get(session_name) != session_config:
-                        await config_utils.update_session_config_in_file(session_name, session_config, CONFIG_PATH)
-                except (AuthKeyUnregisteredError, AuthKeyDuplicatedError, AuthKeyError,
-                      SessionPasswordNeededError, PyrogramAuthKeyUnregisteredError,
-                       PyrogramSessionPasswordNeededError,
-                      PyrogramSessionRevoked, InvalidSession) as e:
-                    logger.error(f"{session_name} | Session initialization error: {e}")
-                    await move_invalid_session_to_error_folder(session_name)
+    stage_started = time.monotonic()
+    ready = await _assign_proxies(prepared, accounts_config)
+    timings['proxies'] = time.monotonic() - stage_started
 
+    # Клиенты создаются по очереди: конструкторы синхронные и только открывают локальные файлы сессий
+    stage_started = time.monotonic()
+    tg_clients = []
+    for session_name, client_params, session_config in ready:
+        try:
+            tg_clients.append(UniversalTelegramClient(**client_params))
+        except _SESSION_INIT_ERRORS as e:
+            logger.error(f"{session_name} | Session initialization error: {e}")
+            await move_invalid_session_to_error_folder(session_name)
+            continue
+        if accounts_store.config.get(session_name) != session_config:
+            accounts_store.update_session_config(session_name, session_config)
+    timings['clients'] = time.monotonic() - stage_started
+
+    stage_started = time.monotonic()
+    await accounts_store.flush()
+    timings['config'] = time.monotonic() - stage_started
+
+    logger.info(
+        f"Bootstrapped {len(tg_clients)}/{len(session_paths)} sessions | "
+        + " | ".join(f"{stage}: {duration:.2f}s" for stage, duration in timings.items())
+    )
     return tg_clients
 
 async def init_config_file() -> None:
@@ -307,11 +380,12 @@ async def init_config_file() -> None:
 
     if not session_paths:
         raise FileNotFoundError("Session files not found")
+    accounts_store = config_utils.AccountsConfigStore.get(CONFIG_PATH)
     for session in session_paths:
         session_name = os.path.basename(session)
         parsed_json = config_utils.import_session_json(session)
         if parsed_json:
-            accounts_config = config_utils.read_config_file(CONFIG_PATH)
+            accounts_config = accounts_store.config
             session_config: dict = deepcopy(accounts_config.get(session_name, {}))
             session_config['user_agent'] = session_config.get('user_agent', generate_random_user_agent())
             session_config['api'] = parsed_json
@@ -324,11 +398,14 @@ async def run_tasks() -> None:
     
     base_tasks = []
     
-    if settings.AUTO_UPDATE:
-        update_manager = UpdateManager()
+    # Один UpdateManager на весь процесс: сессии сами обновления не проверяют
+    update_manager = UpdateManager() if settings.AUTO_UPDATE else None
+    if update_manager is not None:
         base_tasks.append(asyncio.create_task(update_manager.run()))
     
     tg_clients = await get_tg_clients()
+    if settings.USE_PROXY and not settings.DISABLE_PROXY_REPLACE:
+        ProxyPool.get(PROXIES_PATH).start()
     # Отправка уведомления о запуске приложения
     if hasattr(settings, 'NOTIFICATION_CHAT_ID') and settings.NOTIFICATION_CHAT_ID:
         bot = BaseBot(None)
@@ -337,11 +414,25 @@ async def run_tasks() -> None:
             asyncio.create_task(bot._send_telegram_message(settings.NOTIFICATION_CHAT_ID, message))
         except Exception:
             pass
-    client_tasks = [asyncio.create_task(handle_tapper_session(tg_client=tg_client)) for tg_client in tg_clients]
+    # Каталог розыгрышей один на все сессии: его скачивает любая рабочая сессия раз в TTL
+    catalog = GiveawayCatalog()
+    client_tasks = [
+        asyncio.create_task(handle_tapper_session(tg_client=tg_client, catalog=catalog)) for tg_client in tg_clients
+    ]
     
     try:
         if client_tasks:
-            await asyncio.gather(*client_tasks, return_exceptions=True)
+            sessions_done = asyncio.gather(*client_tasks, return_exceptions=True)
+            if update_manager is not None:
+                restart_wait = asyncio.create_task(update_manager.restart_requested.wait())
+                await asyncio.wait({sessions_done, restart_wait}, return_when=asyncio.FIRST_COMPLETED)
+                restart_wait.cancel()
+                if update_manager.restart_requested.is_set():
+                    # Отмена даёт сессиям отработать finally: закрыть соединения и сохранить состояние
+                    logger.info("Stopping sessions to restart after update...")
+                    for task in client_tasks:
+                        task.cancel()
+            await sessions_done
         
         for task in base_tasks:
             if not task.done():
@@ -355,12 +446,24 @@ async def run_tasks() -> None:
                 task.cancel()
         await asyncio.gather(*client_tasks + base_tasks, return_exceptions=True)
         raise
+    finally:
+        await ChannelRepository.close_all()
+        await ProxyPool.close_all()
+        await HttpClientRegistry.close_all()
+        await config_utils.AccountsConfigStore.close_all()
+
+    if update_manager is not None and update_manager.restart_requested.is_set():
+        update_manager.restart()
         
-async def handle_tapper_session(tg_client: UniversalTelegramClient, stats_bot: Optional[object] = None):
+async def handle_tapper_session(
+    tg_client: UniversalTelegramClient,
+    stats_bot: Optional[object] = None,
+    catalog: Optional[GiveawayCatalog] = None
+):
     session_name = tg_client.session_name
     try:
         logger.info(f"{session_name} | Starting session")
-        await run_tapper(tg_client=tg_client)
+        await run_tapper(tg_client=tg_client, catalog=catalog)
     except InvalidSession as e:
         logger.error(f"Invalid session: {session_name}: {e}")
         await move_invalid_session_to_error_folder(session_name)
@@ -375,4 +478,8 @@ async def handle_tapper_session(tg_client: UniversalTelegramClient, stats_bot: O
     except Exception as e:
         logger.error(f"Unexpected error in session {session_name}: {e}")
     finally:
+        try:
+            await tg_client.close()
+        except Exception as e:
+            logger.warning(f"{session_name} | Failed to close Telegram connection: {e}")
         logger.info(f"{session_name} | Session ended")
@@ -4,6 +4,7 @@ from telethon import TelegramClient
 from pyrogram import Client
 from bot.config import settings
 from bot.utils import logger, proxy_utils, config_utils, CONFIG_PATH, PROXIES_PATH, SESSIONS_PATH
+from bot.utils.proxy_pool import ProxyPool
 
 
 API_ID = settings.API_ID
@@ -40,17 +41,13 @@ async def register_sessions() -> None:
     proxy = None
 
     if settings.USE_PROXY:
-        proxies = proxy_utils.get_unused_proxies(accounts_config, PROXIES_PATH)
-        if not proxies:
-            raise Exception('No unused proxies left')
-        for prox in proxies:
-            if await proxy_utils.check_proxy(prox):
-                proxy_str = prox
-                proxy = Proxy.from_str(proxy_str)
-                accounts_data['proxy'] = proxy_str
-                break
-        else:
+        proxy_pool = ProxyPool.get(PROXIES_PATH)
+        proxy_pool.set_usage(accounts_config)
+        proxy_str = await proxy_pool.acquire_working()
+        if not proxy_str:
             raise Exception('No unused proxies left')
+        proxy = Proxy.from_str(proxy_str)
+        accounts_data['proxy'] = proxy_str
     accounts_data['proxy'] = None
 
     accounts_config[session_name] = accounts_data
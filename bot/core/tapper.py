@@ -1,17 +1,23 @@
 import aiohttp
 import asyncio
+import base64
+import json
 import re
 import random
 import datetime
-from typing import Optional, Dict, Any, List, Set
+import os
+import socket
+import time
+from typing import Optional, Dict, Any, List, Set, Tuple
 from urllib.parse import unquote
 
 from bot.config.config import settings
-from bot.utils import logger
+from bot.utils import logger, config_utils, init_data_cache, CONFIG_PATH
 from bot.utils.first_run import check_is_first_run, append_recurring_session
-from bot.utils.updater import UpdateManager
 from bot.exceptions.error_handler import ErrorHandler, UnauthorizedError
-from bot.utils.channel_repository import ChannelRepository
+from bot.utils.channel_repository import ChannelRepository, PendingGiveaway
+from bot.utils.http_client import HttpClientRegistry
+from bot.core.giveaway_catalog import GiveawayCatalog
 
 
 class BaseBot:
@@ -44,6 +50,11 @@ class BaseBot:
                       '(KHTML, like Gecko) Version/16.6 Mobile/15E148 Safari/604.1',
     }
 
+    # Токен короче этого считается отозванным сервером, а не истёкшим
+    MIN_TOKEN_LIFETIME: int = 600
+    # Пауза после каждого обновления токена, чтобы не запрашивать /auth подряд
+    MIN_TOKEN_REFRESH_INTERVAL: int = 60
+
     EMOJI = {
         'debug': '🔍',
         'success': '✅',
@@ -54,14 +65,24 @@ class BaseBot:
         'giveaway': '⭐'
     }
 
-    _channel_action_counts: Dict[str, int] = {"subscribe": 0, "unsubscribe": 0}
-    _channel_action_window_start: datetime.datetime = datetime.datetime.now()
-
-    def __init__(self, tg_client: Any):
+    def __init__(self, tg_client: Any, proxy: Optional[str] = None):
         self._tg_client = tg_client
+        # Запросы к API идут через прокси сессии из accounts_config.json (его выбирает лаунчер)
+        self._proxy: Optional[str] = proxy or self._load_session_proxy()
+        # Лимиты действий с каналами считаются для каждой сессии отдельно
+        self._channel_action_counts: Dict[str, int] = {"subscribe": 0, "unsubscribe": 0}
+        self._channel_action_window_start: datetime.datetime = datetime.datetime.now()
+        self._rate_limit_lock = asyncio.Lock()
+        # Telegram-клиент сам подключается и отключается вокруг вызова, параллельные вызовы ему нельзя
+        self._telegram_lock = asyncio.Lock()
         self._token: Optional[str] = None
+        # Время выдачи и истечения токена (epoch); срок берётся из JWT или узнаётся по 401
+        self._token_issued_at: Optional[float] = None
+        self._token_expires_at: Optional[float] = None
+        self._learned_token_lifetime: Optional[float] = None
+        # Одновременно выполняется только одна повторная авторизация
+        self._auth_lock = asyncio.Lock()
         self._giveaway_id: Optional[str] = None
-        self._http_client: Optional[aiohttp.ClientSession] = None
         self._current_ref_id: Optional[str] = None
         self._logger = logger
 
@@ -96,15 +117,19 @@ class BaseBot:
     def giveaway_id(self) -> Optional[str]:
         return self._giveaway_id
 
-    async def _get_http_client(self) -> aiohttp.ClientSession:
-        if self._http_client is None or self._http_client.closed:
-            self._http_client = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(60))
-        return self._http_client
+    def _load_session_proxy(self) -> Optional[str]:
+        session_name = getattr(self._tg_client, "session_name", None)
+        if not session_name:
+            return None
+        return config_utils.get_session_config(session_name, CONFIG_PATH).get('proxy') or None
+
+    async def _get_http_client(self, url: str = API_BASE_URL) -> aiohttp.ClientSession:
+        # Сессии общие для всего процесса: боты за одним прокси переиспользуют его соединения
+        return await HttpClientRegistry.get_session(url, proxy=self._proxy)
 
     async def close(self) -> None:
-        if self._http_client is not None and not self._http_client.closed:
-            await self._http_client.close()
-            self._http_client = None
+        # HTTP-сессии принадлежат HttpClientRegistry и закрываются лаунчером
+        pass
 
     async def get_ref_id(self) -> str:
         if self._current_ref_id is None:
@@ -124,9 +149,18 @@ class BaseBot:
 
         return self._current_ref_id
 
-    async def auth(self) -> Dict[str, Any]:
-        client = await self._get_http_client()
-        headers = self.DEFAULT_HEADERS.copy()
+    async def _get_init_data(self, use_cache: bool = True) -> Tuple[str, bool]:
+        """Возвращает (tgWebAppData, взято_из_кэша).
+
+        Свежие данные из кэша сессии избавляют от подключения к Telegram ради одного запроса.
+        """
+        session_name = getattr(self._tg_client, "session_name", "unknown_session")
+        if use_cache:
+            cached_init_data = await init_data_cache.get_cached_init_data(session_name, settings.INIT_DATA_MAX_AGE)
+            if cached_init_data:
+                self._log('debug', 'Используем сохранённые tgWebAppData.', 'debug')
+                return cached_init_data, True
+
         self._log('debug', 'Попытка получения tg_webview_url...', 'debug')
         try:
             ref_id_to_use = await self.get_ref_id()
@@ -149,42 +183,138 @@ class BaseBot:
         decoded_once = unquote(encoded_data)
         decoded_twice = unquote(decoded_once)
         self._log('debug', f'tg_web_data (декодировано): {decoded_twice}', 'debug')
+        if self._tg_client is not None:
+            await init_data_cache.save_init_data(session_name, decoded_twice)
+        return decoded_twice, False
+
+    async def auth(self) -> Dict[str, Any]:
+        client = await self._get_http_client()
+        headers = self.DEFAULT_HEADERS.copy()
 
         photo = getattr(self._tg_client, "photo", "")
         self._log('debug', f'Фото: {photo}', 'debug')
 
-        data = {"data": decoded_twice, "photo": photo, "appId": None}
-        self._log('debug', 'Отправка запроса авторизации...', 'info')
+        use_cache = True
+        while True:
+            init_data, from_cache = await self._get_init_data(use_cache)
+            data = {"data": init_data, "photo": photo, "appId": None}
+            self._log('debug', 'Отправка запроса авторизации...', 'info')
 
-        async with client.post(self.AUTH_URL, headers=headers, json=data) as resp:
-            self._log('debug', f'Статус ответа авторизации: {resp.status}', 'info')
-            if resp.status != 200:
-                response_text = await resp.text()
-                self._log('error', f'Авторизация не удалась: {resp.status} {response_text}', 'error')
-                raise Exception(f"Авторизация не удалась: {resp.status} {response_text}")
+            async with client.post(self.AUTH_URL, headers=headers, json=data) as resp:
+                self._log('debug', f'Статус ответа авторизации: {resp.status}', 'info')
+                if resp.status != 200:
+                    response_text = await resp.text()
+                    if from_cache:
+                        # Сервер не принял сохранённые данные — получаем новые у Telegram
+                        self._log('debug', f'Сохранённые tgWebAppData отклонены: {resp.status} {response_text}', 'debug')
+                        init_data_cache.drop_init_data(getattr(self._tg_client, "session_name", "unknown_session"))
+                        use_cache = False
+                        continue
+                    self._log('error', f'Авторизация не удалась: {resp.status} {response_text}', 'error')
+                    raise Exception(f"Авторизация не удалась: {resp.status} {response_text}")
 
-            result: Dict[str, Any] = await resp.json()
-            self._token = result.get("token")
-            self._giveaway_id = result.get("giveawayId")
+                result: Dict[str, Any] = await resp.json()
+                break
 
-            if self._token:
-                self._log('info', 'Авторизация успешна. Токен получен.', 'success')
-            else:
-                self._log('error', 'Авторизация успешна, но токен не получен.', 'error')
-                raise Exception("Авторизация успешна, но токен не получен")
+        self._token = result.get("token")
+        self._giveaway_id = result.get("giveawayId")
+        if self._token:
+            self._record_token_lifetime(self._token)
 
-            await self._random_delay()
-            return result
+        if self._token:
+            self._log('info', 'Авторизация успешна. Токен получен.', 'success')
+        else:
+            self._log('error', 'Авторизация успешна, но токен не получен.', 'error')
+            raise Exception("Авторизация успешна, но токен не получен")
+
+        await self._random_delay()
+        return result
 
-    async def _reauthenticate(self) -> bool:
-        self._log('info', 'Попытка повторной авторизации...', 'info')
+    @staticmethod
+    def _decode_jwt_claims(token: str) -> Dict[str, Any]:
+        parts = token.split('.')
+        if len(parts) != 3:
+            return {}
         try:
-            await self.auth()
-            self._log('success', 'Повторная авторизация успешна.', 'success')
-            return True
-        except Exception as e:
-            self._log('error', f'Повторная авторизация не удалась: {e}', 'error')
+            payload = parts[1] + '=' * (-len(parts[1]) % 4)
+            claims = json.loads(base64.urlsafe_b64decode(payload))
+        except (ValueError, TypeError):
+            return {}
+        return claims if isinstance(claims, dict) else {}
+
+    def _record_token_lifetime(self, token: str) -> None:
+        now = time.time()
+        claims = self._decode_jwt_claims(token)
+        issued_at = claims.get("iat")
+        expires_at = claims.get("exp")
+        self._token_issued_at = float(issued_at) if isinstance(issued_at, (int, float)) else now
+        if isinstance(expires_at, (int, float)):
+            self._token_expires_at = float(expires_at)
+        elif self._learned_token_lifetime:
+            self._token_expires_at = self._token_issued_at + self._learned_token_lifetime
+        else:
+            self._token_expires_at = None
+        if self._token_expires_at:
+            self._log('debug', f'Токен действителен ещё {int(self._token_expires_at - now)} сек.', 'debug')
+
+    def _learn_token_lifetime_from_401(self) -> None:
+        # Непрозрачный токен: срок жизни узнаём по первому 401 и дальше обновляем токен заранее
+        if self._token_issued_at is None:
+            return
+        # Ранний 401 — скорее отзыв токена сервером, чем истечение: такой срок не запоминаем
+        lifetime = time.time() - self._token_issued_at
+        if lifetime < self.MIN_TOKEN_LIFETIME:
+            self._log('debug', f'401 через {int(lifetime)} сек. после выдачи токена — срок жизни не обновлён', 'debug')
+            return
+        self._learned_token_lifetime = lifetime
+        self._log('debug', f'Срок жизни токена по 401: ~{int(lifetime)} сек.', 'debug')
+
+    def _token_needs_refresh(self, margin: float = 0) -> bool:
+        if self._token_expires_at is None:
             return False
+        return time.time() >= self._token_expires_at - margin
+
+    def _token_refresh_margin(self) -> float:
+        # Для короткоживущего токена запас не больше половины срока, иначе он «истекает» сразу после выдачи
+        margin = settings.TOKEN_REFRESH_MARGIN
+        if self._token_expires_at is not None and self._token_issued_at is not None:
+            margin = min(margin, (self._token_expires_at - self._token_issued_at) / 2)
+        return max(margin, 0)
+
+    async def _reauthenticate(self, stale_token: Optional[str] = None) -> bool:
+        """Повторно авторизуется, если токен всё ещё stale_token.
+
+        Запросы, получившие 401 одновременно, ждут одну авторизацию и используют её результат.
+        """
+        async with self._auth_lock:
+            if stale_token is not None and self._token and self._token != stale_token:
+                return True
+            self._log('info', 'Попытка повторной авторизации...', 'info')
+            try:
+                await self.auth()
+                self._log('success', 'Повторная авторизация успешна.', 'success')
+                return True
+            except Exception as e:
+                self._log('error', f'Повторная авторизация не удалась: {e}', 'error')
+                return False
+
+    async def run_token_refresher(self) -> None:
+        """Фоновая задача: обновляет токен за TOKEN_REFRESH_MARGIN секунд (не больше половины срока) до истечения."""
+        while True:
+            if self._token_expires_at is None:
+                # Срок неизвестен — ждём, пока его сообщит JWT или первый 401
+                await asyncio.sleep(settings.TOKEN_REFRESH_MARGIN)
+                continue
+            margin = self._token_refresh_margin()
+            if not self._token_needs_refresh(margin):
+                await asyncio.sleep(self._token_expires_at - margin - time.time())
+                continue
+            stale_token = self._token
+            if not await self._reauthenticate(stale_token) or self._token == stale_token:
+                # Не удалось или срок не сдвинулся — не долбим авторизацию в цикле
+                await asyncio.sleep(settings.TOKEN_REFRESH_MARGIN)
+            else:
+                await asyncio.sleep(self.MIN_TOKEN_REFRESH_INTERVAL)
 
     async def _make_api_request(
         self,
@@ -196,6 +326,9 @@ class BaseBot:
         retries: int = 2
     ) -> Dict[str, Any]:
         client = await self._get_http_client()
+        # Обычно токен заранее обновляет run_token_refresher; здесь — если он уже истёк
+        if self._token_needs_refresh():
+            await self._reauthenticate(self.token)
         current_headers = self.DEFAULT_HEADERS.copy()
         if self.token:
             current_headers["authorization"] = self.token
@@ -218,9 +351,12 @@ class BaseBot:
 
             except aiohttp.ClientResponseError as e:
                 if e.status == 401:
+                    stale_token = current_headers.get("authorization")
+                    if stale_token == self.token:
+                        self._learn_token_lifetime_from_401()
                     if attempt < retries:
                         self._log('warning', f'Получен 401 Unauthorized. Попытка повторной авторизации (попытка {attempt + 1}/{retries})...', 'warning')
-                        if await self._reauthenticate():
+                        if await self._reauthenticate(stale_token):
                             current_headers["authorization"] = self.token
                             continue
                         else:
@@ -359,6 +495,11 @@ class BaseBot:
 
 
     async def _check_and_apply_rate_limit(self, action_type: str) -> None:
+        # Параллельные обработчики розыгрышей занимают лимит по очереди, иначе счётчик можно превысить
+        async with self._rate_limit_lock:
+            await self._apply_rate_limit(action_type)
+
+    async def _apply_rate_limit(self, action_type: str) -> None:
         now = datetime.datetime.now()
         if (now - self._channel_action_window_start).total_seconds() >= 60:
             self._log('debug', 'Окно минуты для действий с каналами сброшено.', 'debug')
@@ -378,6 +519,7 @@ class BaseBot:
         if current_count >= max_limit:
             self._log('info', f'Лимит на <y>{action_type}</y> ({max_limit} в минуту) достигнут. Ожидание до начала следующей минуты.', 'warning')
             await self._wait_for_next_minute()
+            self._channel_action_counts = {"subscribe": 0, "unsubscribe": 0}
 
         self._channel_action_counts[action_type] += 1
         self._log('debug', f'Выполнено {self._channel_action_counts[action_type]}/{max_limit} <y>{action_type}</y> действий в текущей минуте.', 'debug')
@@ -388,8 +530,8 @@ class BaseBot:
             self._log('debug', 'Токен для уведомлений Telegram не настроен.', 'warning')
             return False
 
-        client = await self._get_http_client()
         url = f'https://api.telegram.org/bot{settings.NOTIFICATION_BOT_TOKEN}/sendMessage'
+        client = await self._get_http_client(url)
         payload = {
             'chat_id': chat_id,
             'text': message,
@@ -412,13 +554,22 @@ class BaseBot:
 
 
 class GiveawayProcessor:
-    def __init__(self, bot: BaseBot, channel_repository: ChannelRepository):
+    # Как часто планировщик перепроверок заглядывает в БД, даже если ближайших записей нет
+    _VALIDATION_SCHEDULER_MAX_SLEEP: float = 300.0
+
+    def __init__(self, bot: BaseBot, channel_repository: ChannelRepository, catalog: Optional[GiveawayCatalog] = None):
         self._bot = bot
         self._channel_repository = channel_repository
+        # Без общего каталога (запуск вне лаунчера) сессия скачивает каталог сама
+        self._catalog = catalog or GiveawayCatalog(channel_repository)
         self._inactivity_threshold_hours = getattr(settings, 'GIVEAWAY_CHANNEL_INACTIVITY_HOURS', 12)
         self._check_interval_seconds = getattr(settings, 'GIVEAWAY_CHANNEL_LEAVE_CHECK_INTERVAL', 3600)
         self._last_leave_check_time: datetime.datetime = datetime.datetime.now() - datetime.timedelta(
             seconds=self._check_interval_seconds)
+        # Идентификатор владельца аренды в общей очереди pending_giveaways
+        self._worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        # Будит планировщик перепроверок, когда в очередь попадает новая запись
+        self._validation_wakeup = asyncio.Event()
 
     async def _filter_giveaways(self, giveaways: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         filtered = []
@@ -468,7 +619,10 @@ class GiveawayProcessor:
 
     async def _check_and_fulfill_channel_validation(
         self, giveaway_id: str, channel_name: str, current_is_member_status: str, giveaway_end_at: str = None
-    ) -> bool:
+    ) -> Optional[bool]:
+        """Проверяет подписку на канал и при необходимости подписывается.
+        Возвращает None, если подтверждение подписки поставлено в очередь перепроверок.
+        """
         session_name = getattr(self._bot._tg_client, "session_name", "unknown_session")
         # Если статус Validated — подтверждаем, убираем timeout если был
         if current_is_member_status == "Validated":
@@ -498,9 +652,10 @@ class GiveawayProcessor:
         self._bot._log('debug', f'Попытка подписаться на канал <y>{channel_name}</y>', 'debug')
         try:
             await self._bot._check_and_apply_rate_limit("subscribe")
-            channel_join_success = await self._bot._tg_client.join_telegram_channel(
-                {"additional_data": {"username": channel_name}}
-            )
+            async with self._bot._telegram_lock:
+                channel_join_success = await self._bot._tg_client.join_telegram_channel(
+                    {"additional_data": {"username": channel_name}}
+                )
             if not channel_join_success:
                 self._bot._log('info', f'Не удалось вступить в канал <y>{channel_name}</y>.', 'warning')
                 return False
@@ -513,48 +668,141 @@ class GiveawayProcessor:
             )
             if start_validation_result.get("status") != "Success":
                 self._bot._log('info', f'Серверная валидация канала <y>{channel_name}</y> не запущена: {start_validation_result.get("message")}', 'warning')
-            max_retries = 10
-            min_delay = 360
-            max_delay = 7200
-            for attempt in range(max_retries):
-                # Интервал увеличивается от min_delay до max_delay
-                delay = min_delay + (max_delay - min_delay) * attempt // (max_retries - 1)
-                await asyncio.sleep(delay)
-                validations_after_sub = await self._bot.check_giveaway_validations(giveaway_id)
-                updated_is_member_status = next(
-                    (cv.get("isMember") for cv in validations_after_sub.get("channelValidations", []) if cv["channel"] == channel_name),
-                    None
-                )
-                if updated_is_member_status == "Validated":
+            # Сервер подтверждает подписку с задержкой: ставим перепроверку в очередь и не ждём её
+            await self._schedule_validation_recheck(giveaway_id, channel_name, 0, giveaway_end_at)
+            return None
+        except ValueError as ve:
+            self._bot._log('info', f'Ошибка при вступлении в канал <y>{channel_name}</y>: {ve}', 'warning')
+            return False
+        except Exception as e:
+            self._bot._log('info', f'Неизвестная ошибка при вступлении в канал <y>{channel_name}</y>: {e}', 'error')
+            return False
+
+    @staticmethod
+    def _validation_recheck_delay(attempt: int) -> int:
+        # Интервал увеличивается от CHANNEL_VALIDATION_MIN_DELAY до CHANNEL_VALIDATION_MAX_DELAY
+        max_retries = settings.CHANNEL_VALIDATION_MAX_RETRIES
+        min_delay = settings.CHANNEL_VALIDATION_MIN_DELAY
+        max_delay = settings.CHANNEL_VALIDATION_MAX_DELAY
+        return min_delay + (max_delay - min_delay) * attempt // max(max_retries - 1, 1)
+
+    async def _schedule_validation_recheck(
+        self, giveaway_id: str, channel_name: str, attempt: int, giveaway_end_at: Optional[str]
+    ) -> None:
+        session_name = getattr(self._bot._tg_client, "session_name", "unknown_session")
+        delay = self._validation_recheck_delay(attempt)
+        await self._channel_repository.schedule_validation_recheck(
+            session_name, giveaway_id, channel_name, attempt, time.time() + delay, giveaway_end_at
+        )
+        self._bot._log('debug', f'Перепроверка подписки на канал <y>{channel_name}</y> запланирована через {delay} сек.', 'debug')
+        self._validation_wakeup.set()
+
+    async def run_validation_scheduler(self) -> None:
+        """Фоновая задача сессии: выполняет перепроверки подписки, время которых пришло,
+        и возобновляет вступление в розыгрыши, все каналы которых подтверждены.
+        """
+        session_name = getattr(self._bot._tg_client, "session_name", "unknown_session")
+        while True:
+            self._validation_wakeup.clear()
+            timeout = self._VALIDATION_SCHEDULER_MAX_SLEEP
+            try:
+                await self._run_due_validation_rechecks(session_name)
+                next_recheck_at = await self._channel_repository.get_next_validation_recheck_at(session_name)
+                if next_recheck_at is not None:
+                    timeout = min(max(next_recheck_at - time.time(), 0), timeout)
+            except Exception as e:
+                self._bot._log('error', f'Ошибка планировщика перепроверок подписки: {e}', 'error')
+            try:
+                await asyncio.wait_for(self._validation_wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    @staticmethod
+    def _giveaway_has_ended(giveaway_end_at: Optional[str]) -> bool:
+        if not giveaway_end_at:
+            return False
+        try:
+            end_at = datetime.datetime.fromisoformat(giveaway_end_at)
+        except ValueError:
+            return False
+        if end_at.tzinfo is None:
+            end_at = end_at.replace(tzinfo=datetime.timezone.utc)
+        return end_at <= datetime.datetime.now(datetime.timezone.utc)
+
+    async def _abandon_giveaway_validation(self, session_name: str, giveaway_id: str) -> None:
+        # Снимает розыгрыш с перепроверок и из очереди, чтобы он не остался «припаркованным» навсегда
+        await self._channel_repository.remove_validation_rechecks(session_name, giveaway_id)
+        await self._channel_repository.remove_pending_giveaway(session_name, giveaway_id)
+        await self._channel_repository.add_processed_giveaway(giveaway_id)
+        self._bot._log('info', f'Условия для розыгрыша {giveaway_id} не выполнены. Пропускаем.', 'info')
+
+    async def _run_due_validation_rechecks(self, session_name: str) -> None:
+        due_rechecks = await self._channel_repository.get_due_validation_rechecks(session_name, time.time())
+        rechecks_by_giveaway: Dict[str, List[tuple]] = {}
+        for giveaway_id, channel_name, attempt, giveaway_end_at in due_rechecks:
+            rechecks_by_giveaway.setdefault(giveaway_id, []).append((channel_name, attempt, giveaway_end_at))
+
+        for giveaway_id, rechecks in rechecks_by_giveaway.items():
+            if any(self._giveaway_has_ended(giveaway_end_at) for _, _, giveaway_end_at in rechecks):
+                self._bot._log('info', f'Розыгрыш {giveaway_id} уже завершён, перепроверки подписки отменены.', 'info')
+                await self._abandon_giveaway_validation(session_name, giveaway_id)
+                continue
+            try:
+                validations = await self._bot.check_giveaway_validations(giveaway_id)
+            except Exception as e:
+                self._bot._log('warning', f'Не удалось перепроверить подписки для розыгрыша {giveaway_id}: {e}', 'warning')
+                # Ошибка тоже тратит попытку: удалённый или завершённый розыгрыш не перепроверяется бесконечно
+                if any(attempt + 1 >= settings.CHANNEL_VALIDATION_MAX_RETRIES for _, attempt, _ in rechecks):
+                    await self._abandon_giveaway_validation(session_name, giveaway_id)
+                    continue
+                for channel_name, attempt, giveaway_end_at in rechecks:
+                    await self._schedule_validation_recheck(giveaway_id, channel_name, attempt + 1, giveaway_end_at)
+                continue
+
+            statuses = {cv.get("channel"): cv.get("isMember") for cv in validations.get("channelValidations", [])}
+            failed = False
+            for channel_name, attempt, giveaway_end_at in rechecks:
+                status = statuses.get(channel_name)
+                if status == "Validated":
                     await self._channel_repository.update_channel_activity(session_name, channel_name)
-                    await self._channel_repository.update_giveaway_participation_timestamp(
-                        session_name, channel_name
-                    )
+                    await self._channel_repository.update_giveaway_participation_timestamp(session_name, channel_name)
                     await self._channel_repository.remove_channel_timeout(session_name, channel_name, giveaway_id)
+                    await self._channel_repository.remove_validation_recheck(session_name, giveaway_id, channel_name)
                     self._bot._log('info', f' Подписка на канал <y>{channel_name}</y> подтверждена.', 'success')
-                    return True
-                if updated_is_member_status == "TimeOut":
+                elif status == "TimeOut":
                     if giveaway_end_at is None:
                         giveaway_end_at = (datetime.datetime.utcnow() + datetime.timedelta(days=1)).isoformat()
                     await self._channel_repository.mark_channel_timeout(session_name, channel_name, giveaway_id, giveaway_end_at)
                     self._bot._log('warning', f'Канал <y>{channel_name}</y> в статусе TimeOut, отложим повторную проверку.', 'warning')
-                    return False
-                self._bot._log('debug', f'Попытка {attempt+1}/{max_retries}: подписка на канале <y>{channel_name}</y> не подтверждена ( статус: {updated_is_member_status}), ждем {delay} сек.', 'debug')
-            self._bot._log('info', f' Не удалось подтвердить подписку на канале <y>{channel_name}</y> после {max_retries} попыток.', 'error')
-            return False
-        except ValueError as ve:
-            self._bot._log('info', f'Ошибка при вступлении в канал <y>{channel_name}</y>: {ve}', 'warning')
-            return False
-        except Exception as e:
-            self._bot._log('info', f'Неизвестная ошибка при вступлении в канал <y>{channel_name}</y>: {e}', 'error')
-            return False
+                    failed = True
+                elif attempt + 1 >= settings.CHANNEL_VALIDATION_MAX_RETRIES:
+                    self._bot._log('info', f' Не удалось подтвердить подписку на канале <y>{channel_name}</y> после {attempt + 1} попыток.', 'error')
+                    failed = True
+                else:
+                    self._bot._log('debug', f'Попытка {attempt + 1}/{settings.CHANNEL_VALIDATION_MAX_RETRIES}: подписка на канале <y>{channel_name}</y> не подтверждена (статус: {status}).', 'debug')
+                    await self._schedule_validation_recheck(giveaway_id, channel_name, attempt + 1, giveaway_end_at)
+
+            if failed:
+                await self._abandon_giveaway_validation(session_name, giveaway_id)
+            elif not await self._channel_repository.has_validation_rechecks(session_name, giveaway_id):
+                # Все каналы подтверждены — сразу возвращаемся к вступлению, не дожидаясь следующего цикла
+                resumed = await self._channel_repository.claim_pending_giveaways(
+                    session_name,
+                    self._worker_id,
+                    1,
+                    settings.GIVEAWAY_QUEUE_LEASE_SECONDS,
+                    settings.GIVEAWAY_QUEUE_MAX_ATTEMPTS,
+                    giveaway_ids=[giveaway_id]
+                )
+                for giveaway in resumed:
+                    await self._process_claimed_giveaway(session_name, giveaway)
 
-    async def _process_giveaway(self, giveaway: Dict[str, Any]) -> Dict[str, Any]:
+    async def _process_giveaway(self, giveaway: PendingGiveaway) -> Dict[str, Any]:
         """Обрабатывает один розыгрыш, пытаясь к нему присоединиться и выполняя валидации каналов.
         Возвращает словарь с результатом обработки, включая success: bool и message: str.
         """
-        giveaway_id = giveaway.get("id")
-        giveaway_title = giveaway.get("previewGift", {}).get("title", "Неизвестно")
+        giveaway_id = giveaway.giveaway_id
+        giveaway_title = giveaway.title or "Неизвестно"
         session_name = getattr(self._bot._tg_client, "session_name", "unknown_session")
 
         try:
@@ -577,12 +825,13 @@ class GiveawayProcessor:
             
             # Добавляем каналы из поля "chanels" корневого объекта giveaway, если их нет в channel_validations
             # Или если channel_validations вообще отсутствует/пуст
-            giveaway_channels = giveaway.get("chanels", [])
+            giveaway_channels = giveaway.channels
             for gc_name in giveaway_channels:
                 # Проверяем, есть ли этот канал уже в channels_to_process
                 if not any(cv.get("channel") == gc_name for cv in channels_to_process):
                     channels_to_process.append({"channel": gc_name, "isMember": None, "isBoosted": None}) # isMember и isBoosted будут определены при проверке
 
+            deferred_channels: List[str] = []
             if can_join:
                 for channel_validation in channels_to_process:
                     channel_name = channel_validation.get("channel")
@@ -600,16 +849,23 @@ class GiveawayProcessor:
 
                     if can_join:
                         channel_validation_ok = await self._check_and_fulfill_channel_validation(
-                            giveaway_id, channel_name, is_member
+                            giveaway_id, channel_name, is_member, giveaway.end_at
                         )
-                        if not channel_validation_ok:
+                        if channel_validation_ok is None:
+                            deferred_channels.append(channel_name)
+                        elif not channel_validation_ok:
                             can_join = False
                             break
 
+                if can_join and deferred_channels:
+                    message = f'Розыгрыш <y>{giveaway_title}</y> ждёт подтверждения подписки на каналы: {", ".join(deferred_channels)}.'
+                    self._bot._log('info', message, 'info')
+                    return {"success": False, "deferred": True, "message": message}
+
                 if can_join:
                     join_result = await self._bot.join_giveaway(giveaway_id, giveaway_title)
                     if join_result.get("success"):
-                        if giveaway.get("validationStatus") == "Validated":
+                        if giveaway.validation_status == "Validated":
                             channel_names = [cv.get("channel") for cv in channels_to_process if cv.get("channel")]
                             channel_info = f" на канале (<y>{channel_names[0]}</y>)" if channel_names else ""
                             self._bot._log('info', f'Присоединились к розыгрышу ⚡<y>{giveaway_title}</y>{channel_info}!', 'success')
@@ -622,7 +878,7 @@ class GiveawayProcessor:
                             await self._channel_repository.add_processed_giveaway(giveaway_id)
                             return {"success": True, "message": f"Присоединились к розыгрышу {giveaway_title}{channel_info}"}
                         else:
-                            message = f'Присоединились к розыгрышу <y>{giveaway_title}</y>, но его "validationStatus" не "Validated" (фактический статус: {giveaway.get("validationStatus")}).'
+                            message = f'Присоединились к розыгрышу <y>{giveaway_title}</y>, но его "validationStatus" не "Validated" (фактический статус: {giveaway.validation_status}).'
                             self._bot._log('warning', message, 'warning')
                             await self._channel_repository.remove_pending_giveaway(session_name, giveaway_id)
                             await self._channel_repository.add_processed_giveaway(giveaway_id)
@@ -636,94 +892,47 @@ class GiveawayProcessor:
                 else:
                     message = f'Условия для розыгрыша <y>{giveaway_title}</y> не выполнены. Пропускаем.'
                     self._bot._log('info', message, 'info')
+                    if deferred_channels:
+                        await self._channel_repository.remove_validation_rechecks(session_name, giveaway_id)
                     await self._channel_repository.remove_pending_giveaway(session_name, giveaway_id)
                     await self._channel_repository.add_processed_giveaway(giveaway_id)
                     return {"success": False, "message": message}
 
+            message = f'Требования розыгрыша <y>{giveaway_title}</y> к аккаунту не выполнены. Пропускаем.'
+            await self._channel_repository.remove_pending_giveaway(session_name, giveaway_id)
+            await self._channel_repository.add_processed_giveaway(giveaway_id)
+            return {"success": False, "message": message}
 
         except Exception as e:
             message = f'Ошибка при обработке розыгрыша <y>{giveaway_title}</y>: {e}'
             self._bot._log('error', message, 'error')
-            # В случае ошибки при обработке, удаляем из pending, но не добавляем в processed, чтобы можно было попробовать снова
-            # await self._channel_repository.remove_pending_giveaway(session_name, giveaway_id)
-            # await self._channel_repository.add_processed_giveaway(giveaway_id) # Не добавляем в processed, если это критическая ошибка
-            return {"success": False, "message": message}
+            # Розыгрыш остаётся в очереди и будет повторён после паузы, пока не исчерпает попытки
+            return {"success": False, "message": message, "retry": True, "error": str(e)}
 
     async def _collect_and_filter_giveaways(self) -> List[Dict[str, Any]]:
-        """Собирает уникальные розыгрыши постранично, фильтрует их и возвращает список подходящих."""
+        """Берёт уникальные розыгрыши из общего каталога, фильтрует их и возвращает список подходящих."""
         self._bot._log('debug', 'Начинаем сбор и фильтрацию уникальных розыгрышей...', 'giveaway')
-        collected_giveaways: List[Dict[str, Any]] = []
-        collected_giveaway_ids_this_run: Set[str] = set()
-        current_cursor = ""
-        page_count = 0
-
         max_giveaways = getattr(settings, 'GIVEAWAY_MAX_PER_RUN', 100)
 
-        while True:
+        try:
+            items = await self._catalog.get_items(
+                getattr(settings, 'GIVEAWAY_LIST_TYPE', "Available"), preferred_bot=self._bot
+            )
+        except Exception as e:
+            self._bot._log('error', f'Ошибка при получении каталога розыгрышей: {e}', 'error')
+            return []
+
+        processed_ids = await self._channel_repository.get_processed_giveaway_ids([item["id"] for item in items])
+        collected_giveaways: List[Dict[str, Any]] = []
+        for item in items:
             if len(collected_giveaways) >= max_giveaways:
                 self._bot._log('info', f'Достигнут лимит ({max_giveaways})', 'giveaway')
                 break
-
-            page_count += 1
-            self._bot._log('debug', f'Запрос страницы {page_count} с cursor="{current_cursor}" (Собрано: {len(collected_giveaways)})...', 'giveaway')
-            try:
-                giveaways_data = await self._bot.get_giveaways_page(
-                    giveaway_type=getattr(settings, 'GIVEAWAY_LIST_TYPE', "Available"),
-                    count=getattr(settings, 'GIVEAWAY_LIST_COUNT', 20),
-                    cursor=current_cursor
-                )
-                items = giveaways_data.get("items", [])
-                self._bot._log('debug', f'На странице {page_count} получено {len(items)} розыгрышей.', 'giveaway')
-
-                if not items:
-                    self._bot._log('debug', 'Получен пустой список элементов на странице — сбор завершен.', 'giveaway')
-                    break
-
-                new_giveaways_on_page = []
-                repeat_found = False
-                for item in items:
-                    if len(collected_giveaways) + len(new_giveaways_on_page) >= max_giveaways:
-                         self._bot._log('debug', f'Добавление следующего розыгрыша превысит лимит {max_giveaways}. Завершаем сбор на текущей странице.', 'debug')
-                         break
-
-
-                    giveaway_id = item.get("id")
-                    if not giveaway_id:
-                        continue
-
-                    # Проверка 1: был ли этот розыгрыш обработан в ПРОШЛЫХ запусках?
-                    if await self._channel_repository.is_giveaway_processed(giveaway_id):
-                        self._bot._log('debug', f'Розыгрыш ID:{giveaway_id} уже был обработан ранее. Пропускаем сбор.', 'debug')
-                        continue
-
-                    # Проверка 2: был ли этот розыгрыш СОБРАН в ТЕКУЩЕМ цикле сбора?
-                    if giveaway_id in collected_giveaway_ids_this_run:
-                        self._bot._log('info', f'Обнаружен повторный розыгрыш ID: {giveaway_id} в текущем цикле сбора. Сбор уникальных розыгрышей завершен.', 'giveaway')
-                        repeat_found = True
-                        break
-
-                    collected_giveaway_ids_this_run.add(giveaway_id)
-                    new_giveaways_on_page.append(item)
-
-                collected_giveaways.extend(new_giveaways_on_page)
-
-                if repeat_found:
-                    break
-
-                next_cursor = giveaways_data.get("nextCursor")
-
-                if not next_cursor:
-                     self._bot._log('debug', 'Получен пустой или отсутствующий nextCursor. Сбор завершен.', 'giveaway')
-                     break
-
-                current_cursor = next_cursor
-                self._bot._log('debug', f'Следующий cursor: "{current_cursor}".', 'giveaway')
-
-                await self._bot._random_delay()
-
-            except Exception as e:
-                self._bot._log('error', f'Ошибка при сборе розыгрышей на странице {page_count}: {e}', 'error')
-                break
+            # Был ли этот розыгрыш обработан в ПРОШЛЫХ запусках?
+            if item["id"] in processed_ids:
+                self._bot._log('debug', f'Розыгрыш ID:{item["id"]} уже был обработан ранее. Пропускаем сбор.', 'debug')
+                continue
+            collected_giveaways.append(item)
 
         filtered_giveaways = await self._filter_giveaways(collected_giveaways)
         self._bot._log('info', f'Отфильтровано {len(filtered_giveaways)} подходящих розыгрышей.', 'giveaway')
@@ -731,34 +940,114 @@ class GiveawayProcessor:
 
     async def _add_filtered_giveaways_to_pending_db(self, giveaways: List[Dict[str, Any]]) -> None:
         session_name = getattr(self._bot._tg_client, "session_name", "unknown_session")
-        added_count = 0
+        giveaway_ids = [giveaway["id"] for giveaway in giveaways if giveaway.get("id")]
+        processed_ids = await self._channel_repository.get_processed_giveaway_ids(giveaway_ids)
+        pending_ids = await self._channel_repository.get_pending_giveaway_ids(session_name, giveaway_ids)
+        dead_ids = await self._channel_repository.get_dead_giveaway_ids(session_name, giveaway_ids)
+        known_ids = processed_ids | pending_ids | dead_ids
+
+        new_giveaways: Dict[str, Dict[str, Any]] = {}
         for giveaway in giveaways:
             giveaway_id = giveaway.get("id")
-            if giveaway_id:
-                if not await self._channel_repository.is_giveaway_processed(giveaway_id) and \
-                   not await self._channel_repository.is_giveaway_pending(session_name, giveaway_id):
-                    await self._channel_repository.add_pending_giveaway(session_name, giveaway_id, giveaway)
-                    added_count += 1
-        self._bot._log('info', f'Добавлено {added_count} новых розыгрышей в очередь.', 'giveaway')
+            if giveaway_id and giveaway_id not in known_ids and giveaway_id not in new_giveaways:
+                new_giveaways[giveaway_id] = giveaway
+
+        await self._channel_repository.add_pending_giveaways_many(session_name, list(new_giveaways.values()))
+        self._bot._log('info', f'Добавлено {len(new_giveaways)} новых розыгрышей в очередь.', 'giveaway')
 
     async def _process_all_pending_giveaways(self) -> Dict[str, int]:
-        session_name = getattr(self._bot._tg_client, "session_name", "unknown_session")
-        pending_giveaways = await self._channel_repository.get_pending_giveaways(session_name)
-        self._bot._log('info', f'Начинаем обработку {len(pending_giveaways)} розыгрышей из очереди.', 'giveaway')
+        """Разбирает очередь сессии пачками, взятыми в аренду.
 
-        successful_joins = 0
-        failed_joins = 0
+        До GIVEAWAY_CONCURRENCY розыгрышей обрабатываются одновременно. Пока они
+        обрабатываются, аренда продлевается в фоне; если процесс упадёт, аренда
+        истечёт и розыгрыши заберёт другой процесс.
+        """
+        session_name = getattr(self._bot._tg_client, "session_name", "unknown_session")
+        lease_seconds = settings.GIVEAWAY_QUEUE_LEASE_SECONDS
+        concurrency = max(settings.GIVEAWAY_CONCURRENCY, 1)
+        self._bot._log('info', 'Начинаем обработку розыгрышей из очереди.', 'giveaway')
+
+        results = {"successful_joins": 0, "failed_joins": 0, "deferred": 0}
+        claimed: Set[str] = set()
+        semaphore = asyncio.Semaphore(concurrency)
+        workers: Set[asyncio.Task] = set()
+
+        async def renew_leases() -> None:
+            while True:
+                await asyncio.sleep(max(lease_seconds / 3, 1))
+                if claimed:
+                    await self._channel_repository.renew_pending_leases(
+                        session_name, self._worker_id, list(claimed), lease_seconds
+                    )
 
-        for giveaway_data in pending_giveaways:
-            result = await self._process_giveaway(giveaway_data)
-            if result.get("success"):
-                successful_joins += 1
-            else:
-                failed_joins += 1
-            await self._bot._random_delay()
+        async def process_one(giveaway_data: PendingGiveaway) -> None:
+            try:
+                try:
+                    result = await self._process_claimed_giveaway(session_name, giveaway_data)
+                except Exception as e:
+                    # Ошибка одного розыгрыша не должна ронять весь цикл; возврат с ошибкой тратит попытку
+                    self._bot._log('error', f'Ошибка при обработке розыгрыша {giveaway_data.giveaway_id}: {e}', 'error')
+                    results["failed_joins"] += 1
+                    await self._channel_repository.release_pending_giveaway(
+                        session_name, giveaway_data.giveaway_id, str(e), settings.GIVEAWAY_QUEUE_RETRY_DELAY
+                    )
+                    claimed.discard(giveaway_data.giveaway_id)
+                    return
+                claimed.discard(giveaway_data.giveaway_id)
+                if result.get("success"):
+                    results["successful_joins"] += 1
+                elif result.get("deferred"):
+                    results["deferred"] += 1
+                else:
+                    results["failed_joins"] += 1
+                await self._bot._random_delay()
+            finally:
+                semaphore.release()
 
-        self._bot._log('info', f'Обработка ожидающих розыгрышей завершена. Успешно присоединились: {successful_joins}, Не удалось: {failed_joins}.', 'giveaway')
-        return {"successful_joins": successful_joins, "failed_joins": failed_joins}
+        heartbeat = asyncio.create_task(renew_leases())
+        try:
+            while True:
+                batch = await self._channel_repository.claim_pending_giveaways(
+                    session_name,
+                    self._worker_id,
+                    max(settings.GIVEAWAY_QUEUE_CLAIM_BATCH_SIZE, concurrency),
+                    lease_seconds,
+                    settings.GIVEAWAY_QUEUE_MAX_ATTEMPTS
+                )
+                if not batch:
+                    break
+                claimed.update(giveaway.giveaway_id for giveaway in batch)
+
+                for giveaway_data in batch:
+                    await semaphore.acquire()
+                    worker = asyncio.create_task(process_one(giveaway_data))
+                    workers.add(worker)
+                    worker.add_done_callback(workers.discard)
+            if workers:
+                await asyncio.gather(*workers)
+        finally:
+            heartbeat.cancel()
+            for worker in list(workers):
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            # Не держим аренду на том, что не успели обработать (например, при отмене задачи)
+            for giveaway_id in claimed:
+                await self._channel_repository.release_pending_giveaway(session_name, giveaway_id)
+
+        self._bot._log('info', f'Обработка ожидающих розыгрышей завершена. Успешно присоединились: {results["successful_joins"]}, Не удалось: {results["failed_joins"]}, Ждут подтверждения подписки: {results["deferred"]}.', 'giveaway')
+        return results
+
+    async def _process_claimed_giveaway(self, session_name: str, giveaway: PendingGiveaway) -> Dict[str, Any]:
+        """Обрабатывает арендованный розыгрыш и возвращает аренду, если он остаётся в очереди."""
+        result = await self._process_giveaway(giveaway)
+        if result.get("retry"):
+            await self._channel_repository.release_pending_giveaway(
+                session_name, giveaway.giveaway_id, result.get("error"), settings.GIVEAWAY_QUEUE_RETRY_DELAY
+            )
+        elif result.get("deferred"):
+            # Пока есть перепроверки, розыгрыш не выдаётся; после них его заберёт планировщик
+            await self._channel_repository.release_pending_giveaway(session_name, giveaway.giveaway_id)
+        return result
 
     async def leave_inactive_channels(self) -> int:
         current_time = datetime.datetime.now()
@@ -784,7 +1073,8 @@ class GiveawayProcessor:
             for channel_id, channel_name in channels_to_leave:
                 self._bot._log('debug', f'Попытка отписаться от канала <y>{channel_name}</y> (ID: {channel_id})...', 'warning')
                 await self._bot._check_and_apply_rate_limit("unsubscribe")
-                leave_success = await self._bot._tg_client.leave_telegram_channel(channel_name)
+                async with self._bot._telegram_lock:
+                    leave_success = await self._bot._tg_client.leave_telegram_channel(channel_name)
 
                 if leave_success:
                     await self._channel_repository.remove_channel(channel_id)
@@ -803,7 +1093,7 @@ class GiveawayProcessor:
             return channels_unsubscribed_count
 
 
-async def run_tapper(tg_client: Any) -> None:
+async def run_tapper(tg_client: Any, catalog: Optional[GiveawayCatalog] = None) -> None:
     bot = BaseBot(tg_client)
 
     channel_repository = ChannelRepository()
@@ -821,11 +1111,8 @@ async def run_tapper(tg_client: Any) -> None:
     else:
         bot._log('warning', 'Настройка PROCESSED_GIVEAWAYS_DAYS_TO_KEEP не найдена. Пропуск очистки старых записей.', 'warning')
 
-    update_task = None
-    if settings.AUTO_UPDATE:
-        update_manager = UpdateManager()
-        update_task = asyncio.create_task(update_manager.run())
-        bot._log('info', 'Задача автоматического обновления запущена.', 'info')
+    validation_task = None
+    token_task = None
 
     error_handler = ErrorHandler(session_manager=bot, logger=bot._logger)
 
@@ -836,7 +1123,11 @@ async def run_tapper(tg_client: Any) -> None:
     try:
         await bot.auth()
 
-        giveaway_processor = GiveawayProcessor(bot, channel_repository)
+        giveaway_processor = GiveawayProcessor(bot, channel_repository, catalog)
+        if catalog is not None:
+            catalog.register(bot)
+        validation_task = asyncio.create_task(giveaway_processor.run_validation_scheduler())
+        token_task = asyncio.create_task(bot.run_token_refresher())
 
         while True:
             # Очищаем истёкшие timeout-ы каналов перед каждым циклом
@@ -902,12 +1193,15 @@ async def run_tapper(tg_client: Any) -> None:
         error_handler.handle_error(str(e))
     finally:
         bot._log('debug', ' Завершение функции run_tapper.', 'info')
-        if update_task:
-            update_task.cancel()
-            try:
-                await update_task
-            except asyncio.CancelledError:
-                bot._log('info', 'Задача автоматического обновления отменена.', 'info')
+        if catalog is not None:
+            catalog.unregister(bot)
+        for background_task in (validation_task, token_task):
+            if background_task:
+                background_task.cancel()
+                try:
+                    await background_task
+                except asyncio.CancelledError:
+                    pass
         await channel_repository.close()
         await bot.close()
 
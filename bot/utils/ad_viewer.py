@@ -9,6 +9,7 @@ from urllib.parse import urlencode
 import json
 
 from bot.utils.logger import logger, log_error
+from bot.utils.http_client import HttpClientRegistry
 from bot.exceptions import AdViewError
 
 
@@ -100,7 +101,7 @@ class AdViewer:
         base_url: str,
         event_url: str,
         block_id: str,
-        http_client: aiohttp.ClientSession,
+        http_client: Optional[aiohttp.ClientSession],
         access_token: str,
         user_id: Union[int, str],
         config: Optional[AdConfig] = None,
@@ -181,7 +182,9 @@ class AdViewer:
                 if self._config.proxy_auth:
                     request_kwargs["proxy_auth"] = aiohttp.BasicAuth(**self._config.proxy_auth)
 
-            async with self._http_client.request(**request_kwargs) as response:
+            # Без своего клиента используем общий пул соединений процесса
+            http_client = self._http_client or await HttpClientRegistry.get_session(url)
+            async with http_client.request(**request_kwargs) as response:
                 if response.status != 200:
                     error_text = await response.text()
                     raise AdViewError(
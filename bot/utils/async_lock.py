@@ -1,29 +1,119 @@
 import asyncio
 import fasteners
-from random import uniform
+import time
 from os import path
+from typing import Dict, Optional
 
+from bot.config import settings
 from bot.utils import logger
 
 
+class _LockState:
+    """Everything shared by the AsyncInterProcessLock instances of one lock file in this process."""
+
+    def __init__(self, lock_file: str):
+        # Coroutines of this process queue here; only the one at the head touches the file lock
+        self.process_lock = asyncio.Lock()
+        self.file_lock = fasteners.InterProcessLock(lock_file)
+        self.holder: Optional[str] = None
+        self.held_since: Optional[float] = None
+        self.waiters = 0
+        self.acquisitions = 0
+        self.contended = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def stats(self) -> dict:
+        return {
+            'holder': self.holder,
+            'held_for': time.monotonic() - self.held_since if self.held_since is not None else 0.0,
+            'waiters': self.waiters,
+            'acquisitions': self.acquisitions,
+            'contended': self.contended,
+            'total_wait': self.total_wait,
+            'max_wait': self.max_wait,
+            'avg_wait': self.total_wait / self.acquisitions if self.acquisitions else 0.0,
+        }
+
+
 class AsyncInterProcessLock:
+    """File lock shared between processes that waits for release instead of polling with long sleeps.
+
+    Coroutines of the same process first queue on an asyncio.Lock, so they are woken up as soon as
+    the previous holder leaves. The one at the head of the queue then waits for the file lock in a
+    worker thread without a timeout, which only blocks while another process holds the file.
+    """
+
+    _states: Dict[str, _LockState] = {}
+
     def __init__(self, lock_file: str):
-        self._lock = fasteners.InterProcessLock(lock_file)
+        self._lock_file = path.abspath(lock_file)
         self._file_name, _ = path.splitext(path.basename(lock_file))
+        self._state = self._states.setdefault(self._lock_file, _LockState(self._lock_file))
 
     async def __aenter__(self) -> 'AsyncInterProcessLock':
-        while True:
-            lock_acquired = await asyncio.to_thread(self._lock.acquire, timeout=uniform(5, 10))
-            if lock_acquired:
-                return self
-            sleep_time = uniform(30, 150)
-            logger_message = (
-                f"<LY><k>{self._file_name}</k></LY> | Failed to acquire lock for "
-                f"{'accounts_config' if 'accounts_config' in self._file_name else 'session'}. "
-                f"Retrying in {int(sleep_time)} seconds"
-            )
-            logger.info(logger_message)
-            await asyncio.sleep(sleep_time)
+        state = self._state
+        started = time.monotonic()
+        contended = state.process_lock.locked()
+        state.waiters += 1
+        try:
+            await state.process_lock.acquire()
+            try:
+                file_locked = state.file_lock.acquire(blocking=False)
+            except BaseException:
+                state.process_lock.release()
+                raise
+            if not file_locked:
+                contended = True
+                await self._acquire_file_lock()
+        finally:
+            state.waiters -= 1
+
+        wait_time = time.monotonic() - started
+        state.acquisitions += 1
+        state.total_wait += wait_time
+        state.max_wait = max(state.max_wait, wait_time)
+        if contended:
+            state.contended += 1
+            if settings.DEBUG_LOGGING:
+                logger.debug(f"<LY><k>{self._file_name}</k></LY> | Lock acquired after waiting {wait_time:.3f}s")
+        task = asyncio.current_task()
+        state.holder = task.get_name() if task is not None else None
+        state.held_since = time.monotonic()
+        return self
+
+    async def _acquire_file_lock(self) -> None:
+        """Waits for the file lock while holding the process lock; releases the process lock on failure."""
+        file_lock, process_lock = self._state.file_lock, self._state.process_lock
+        acquire = asyncio.ensure_future(asyncio.to_thread(file_lock.acquire, blocking=True))
+        try:
+            await asyncio.shield(acquire)
+        except asyncio.CancelledError:
+            # The thread cannot be interrupted: let it finish, then give back whatever it got
+            def release(future: asyncio.Future) -> None:
+                if not future.cancelled() and future.exception() is None:
+                    file_lock.release()
+                process_lock.release()
+
+            acquire.add_done_callback(release)
+            raise
+        except BaseException:
+            process_lock.release()
+            raise
 
     async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
-        await asyncio.to_thread(self._lock.release)
+        state = self._state
+        state.holder = None
+        state.held_since = None
+        try:
+            await asyncio.to_thread(state.file_lock.release)
+        finally:
+            state.process_lock.release()
+
+    def stats(self) -> dict:
+        """Contention metrics of this lock file in the current process; wait times are in seconds."""
+        return self._state.stats()
+
+    @classmethod
+    def all_stats(cls) -> Dict[str, dict]:
+        return {lock_file: state.stats() for lock_file, state in cls._states.items()}
@@ -1,52 +1,462 @@
+import asyncio
+import json
+import time
+import zlib
+import aiofiles
 import aiosqlite
 import datetime # Импортируем datetime для работы с датами
-from typing import Optional, List, Tuple # Добавляем Tuple для подсказки типов
+from contextlib import asynccontextmanager
+from collections.abc import Mapping
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, NamedTuple, Optional, List, Set, Tuple, Union # Добавляем Tuple для подсказки типов
+
+from bot.config import settings
+from bot.utils import logger
+
+
+class _SharedConnection:
+    """Долгоживущее соединение с БД, общее для всех сессий процесса."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.connection: Optional[aiosqlite.Connection] = None
+        self.users = 0
+        self.open_lock = asyncio.Lock()
+        # Держится на время транзакции или чтения: иначе чтение на общем соединении
+        # увидит ещё не зафиксированные строки чужой открытой транзакции
+        self.lock = asyncio.Lock()
+
+    async def get_connection(self) -> aiosqlite.Connection:
+        if self.connection is None:
+            async with self.open_lock:
+                if self.connection is None:
+                    db = await aiosqlite.connect(self.db_path)
+                    await db.execute("PRAGMA journal_mode=WAL")
+                    await db.execute("PRAGMA synchronous=NORMAL")
+                    await db.execute(f"PRAGMA busy_timeout={int(settings.CHANNEL_DB_BUSY_TIMEOUT_MS)}")
+                    self.connection = db
+        return self.connection
+
+    async def close(self) -> None:
+        if self.connection is not None:
+            db, self.connection = self.connection, None
+            await db.close()
+
+
+class _ProcessedGiveawayIndex:
+    """Общий для процесса индекс обработанных розыгрышей в памяти.
+
+    Хранит giveaway_id -> время обработки (UTC, epoch) в порядке добавления, поэтому
+    удаление старых записей идёт с начала словаря. Если записей больше max_size,
+    самые старые вытесняются и индекс перестаёт быть полным: тогда отрицательный
+    ответ перепроверяется в БД, пока очистка по сроку хранения не догонит вытесненные.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.loaded = False
+        self.load_lock = asyncio.Lock()
+        self._entries: Dict[str, float] = {}
+        self._evicted_until: Optional[float] = None
+
+    @property
+    def complete(self) -> bool:
+        return self.loaded and self._evicted_until is None
+
+    def __contains__(self, giveaway_id: str) -> bool:
+        return giveaway_id in self._entries
+
+    def load(self, rows: List[Tuple[str, float]]) -> None:
+        # Записи из БД старше добавленных до загрузки, поэтому идут первыми
+        added_before_load, self._entries = self._entries, {}
+        for giveaway_id, processed_at in rows:
+            self.add(giveaway_id, processed_at)
+        for giveaway_id, processed_at in added_before_load.items():
+            self.add(giveaway_id, processed_at)
+        self.loaded = True
+
+    def add(self, giveaway_id: str, processed_at: Optional[float] = None) -> None:
+        if giveaway_id in self._entries:
+            return
+        self._entries[giveaway_id] = time.time() if processed_at is None else processed_at
+        while len(self._entries) > self.max_size:
+            evicted_at = self._entries.pop(next(iter(self._entries)))
+            self._evicted_until = evicted_at if self._evicted_until is None else max(self._evicted_until, evicted_at)
+
+    def evict_older_than(self, cutoff: float) -> None:
+        while self._entries:
+            oldest_id = next(iter(self._entries))
+            if self._entries[oldest_id] >= cutoff:
+                break
+            del self._entries[oldest_id]
+        if self._evicted_until is not None and self._evicted_until < cutoff:
+            self._evicted_until = None
+
+
+class PendingGiveaway(Mapping):
+    """Розыгрыш из очереди pending_giveaways.
+
+    Поля, нужные для обработки, читаются из отдельных колонок; полный JSON
+    розыгрыша хранится сжатым и распаковывается только при обращении к нему
+    (через data или как к словарю).
+    """
+
+    __slots__ = ("giveaway_id", "title", "channels", "validation_status", "end_at", "_payload", "_data")
+
+    def __init__(
+        self,
+        giveaway_id: str,
+        title: Optional[str],
+        channels: List[str],
+        validation_status: Optional[str],
+        end_at: Optional[str],
+        payload: bytes
+    ):
+        self.giveaway_id = giveaway_id
+        self.title = title
+        self.channels = channels
+        self.validation_status = validation_status
+        self.end_at = end_at
+        self._payload = payload
+        self._data: Optional[Dict[str, Any]] = None
+
+    @property
+    def data(self) -> Dict[str, Any]:
+        if self._data is None:
+            self._data = json.loads(zlib.decompress(self._payload))
+        return self._data
+
+    def __getitem__(self, key: str) -> Any:
+        return self.data[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.data)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+
+class GiveawayCatalogSnapshot(NamedTuple):
+    """Снимок каталога розыгрышей одного типа списка (новые розыгрыши в начале)."""
+    fetched_at: float
+    items: List[Dict[str, Any]]
+    # ID самого нового розыгрыша — граница, до которой листается инкрементальная синхронизация
+    newest_id: Optional[str]
+    full_sync_at: float
+
+
+def _pending_giveaway_row(session_name: str, giveaway: Dict[str, Any], giveaway_id: Optional[str] = None) -> tuple:
+    return (
+        session_name,
+        giveaway_id or giveaway["id"],
+        (giveaway.get("previewGift") or {}).get("title"),
+        ",".join(giveaway.get("chanels") or []),
+        giveaway.get("validationStatus"),
+        giveaway.get("endAt"),
+        zlib.compress(json.dumps(giveaway, separators=(",", ":"), ensure_ascii=False).encode()),
+    )
+
+
+def _pending_giveaway_from_row(row: tuple) -> PendingGiveaway:
+    giveaway_id, title, channels, validation_status, end_at, payload = row
+    return PendingGiveaway(giveaway_id, title, channels.split(",") if channels else [], validation_status, end_at, payload)
+
+
+_PENDING_GIVEAWAY_INSERT = (
+    "INSERT OR IGNORE INTO pending_giveaways "
+    "(session_name, giveaway_id, title, channels, validation_status, end_at, payload) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+async def _migrate_pending_payloads(db: aiosqlite.Connection) -> None:
+    # Пересобираем таблицу: горячие поля — в колонки, остальное — в сжатый payload
+    await db.execute(
+        "CREATE TABLE pending_giveaways_compact ("
+        "session_name TEXT NOT NULL, "
+        "giveaway_id TEXT NOT NULL, "
+        "title TEXT NULL, "
+        "channels TEXT NOT NULL DEFAULT '', "
+        "validation_status TEXT NULL, "
+        "end_at TEXT NULL, "
+        "payload BLOB NOT NULL, "
+        "added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, "
+        "PRIMARY KEY (session_name, giveaway_id))"
+    )
+    cursor = await db.execute("SELECT session_name, giveaway_id, giveaway_data, added_at FROM pending_giveaways")
+    rows = await cursor.fetchall()
+    await cursor.close()
+    # Ключ берём из колонки giveaway_id: в старых записях JSON мог быть без "id"
+    await db.executemany(
+        "INSERT OR IGNORE INTO pending_giveaways_compact "
+        "(session_name, giveaway_id, title, channels, validation_status, end_at, payload, added_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [(*_pending_giveaway_row(session_name, json.loads(giveaway_data), giveaway_id), added_at)
+         for session_name, giveaway_id, giveaway_data, added_at in rows]
+    )
+    await db.execute("DROP TABLE pending_giveaways")
+    await db.execute("ALTER TABLE pending_giveaways_compact RENAME TO pending_giveaways")
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_pending_giveaways_session_added "
+        "ON pending_giveaways (session_name, added_at)"
+    )
+
+
+async def _import_first_run_file(db: aiosqlite.Connection) -> None:
+    # Переносим сессии из first_run.txt, которым раньше отслеживался первый запуск
+    try:
+        async with aiofiles.open('first_run.txt', mode='r') as file:
+            lines = await file.readlines()
+    except FileNotFoundError:
+        return
+    await db.executemany(
+        "INSERT OR IGNORE INTO recurring_sessions (session_name) VALUES (?)",
+        [(name,) for name in {line.strip().lower() for line in lines} if name]
+    )
+
+
+# Миграции схемы по порядку версий. Шаг — SQL-строка или корутина, принимающая соединение.
+# Каждая версия применяется в отдельной транзакции и записывается в schema_version.
+_MIGRATIONS: List[Tuple[int, Tuple[Union[str, Callable[[aiosqlite.Connection], Awaitable[None]]], ...]]] = [
+    (1, (
+        "CREATE TABLE IF NOT EXISTS subscribed_channels ("
+        "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+        "session_name TEXT NOT NULL, "
+        "channel_name TEXT NOT NULL, "
+        "last_activity_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, "
+        "giveaway_participation_at TIMESTAMP NULL, "
+        "UNIQUE(session_name, channel_name))",
+        # Таблица для обработанных розыгрышей
+        "CREATE TABLE IF NOT EXISTS processed_giveaways ("
+        "giveaway_id TEXT NOT NULL UNIQUE, "
+        "processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)",
+        # Таблица для ожидающих обработки розыгрышей
+        "CREATE TABLE IF NOT EXISTS pending_giveaways ("
+        "session_name TEXT NOT NULL, "
+        "giveaway_id TEXT NOT NULL, "
+        "giveaway_data TEXT NOT NULL, "
+        "added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, "
+        "PRIMARY KEY (session_name, giveaway_id))",
+        # Таблица для каналов в статусе timeout
+        "CREATE TABLE IF NOT EXISTS channel_timeouts ("
+        "session_name TEXT NOT NULL, "
+        "channel_name TEXT NOT NULL, "
+        "giveaway_id TEXT NOT NULL, "
+        "timeout_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, "
+        "giveaway_end_at TIMESTAMP NOT NULL, "
+        "PRIMARY KEY (session_name, channel_name, giveaway_id))",
+    )),
+    # Индексы под горячие запросы очистки и выборки очереди
+    (2, (
+        # get_channels_to_leave: покрывающий индекс, id — это rowid
+        "CREATE INDEX IF NOT EXISTS idx_subscribed_channels_activity "
+        "ON subscribed_channels (session_name, last_activity_at, giveaway_participation_at, channel_name)",
+        # get_pending_giveaways: выборка сессии уже отсортирована по added_at
+        "CREATE INDEX IF NOT EXISTS idx_pending_giveaways_session_added "
+        "ON pending_giveaways (session_name, added_at)",
+        # clear_expired_timeouts
+        "CREATE INDEX IF NOT EXISTS idx_channel_timeouts_end "
+        "ON channel_timeouts (giveaway_end_at)",
+        # clear_old_processed_giveaways и загрузка индекса в памяти
+        "CREATE INDEX IF NOT EXISTS idx_processed_giveaways_processed_at "
+        "ON processed_giveaways (processed_at)",
+    )),
+    # Компактное хранение очереди розыгрышей
+    (3, (_migrate_pending_payloads,)),
+    # Очередь с арендой (lease): несколько процессов могут разбирать её без дублей
+    (4, (
+        "ALTER TABLE pending_giveaways ADD COLUMN lease_owner TEXT NULL",
+        "ALTER TABLE pending_giveaways ADD COLUMN lease_expires_at REAL NULL",
+        "ALTER TABLE pending_giveaways ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE pending_giveaways ADD COLUMN last_error TEXT NULL",
+        "CREATE TABLE IF NOT EXISTS dead_giveaways ("
+        "session_name TEXT NOT NULL, "
+        "giveaway_id TEXT NOT NULL, "
+        "title TEXT NULL, "
+        "payload BLOB NOT NULL, "
+        "attempts INTEGER NOT NULL, "
+        "last_error TEXT NULL, "
+        "dead_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, "
+        "PRIMARY KEY (session_name, giveaway_id))",
+    )),
+    # Общий для всех сессий снимок каталога розыгрышей
+    (5, (
+        "CREATE TABLE IF NOT EXISTS giveaway_catalog ("
+        "list_type TEXT PRIMARY KEY, "
+        "fetched_at REAL NOT NULL, "
+        "payload BLOB NOT NULL)",
+    )),
+    # Состояние инкрементальной синхронизации каталога
+    (6, (
+        "ALTER TABLE giveaway_catalog ADD COLUMN newest_id TEXT NULL",
+        "ALTER TABLE giveaway_catalog ADD COLUMN full_sync_at REAL NULL",
+    )),
+    # Очередь отложенных перепроверок подписки на каналы
+    (7, (
+        "CREATE TABLE IF NOT EXISTS validation_rechecks ("
+        "session_name TEXT NOT NULL, "
+        "giveaway_id TEXT NOT NULL, "
+        "channel_name TEXT NOT NULL, "
+        "attempt INTEGER NOT NULL, "
+        "due_at REAL NOT NULL, "
+        "giveaway_end_at TEXT NULL, "
+        "PRIMARY KEY (session_name, giveaway_id, channel_name))",
+        "CREATE INDEX IF NOT EXISTS idx_validation_rechecks_due "
+        "ON validation_rechecks (session_name, due_at)",
+    )),
+    # Кэш разрешённых username каналов, чтобы не тратить ResolveUsername на каждое действие
+    (8, (
+        "CREATE TABLE IF NOT EXISTS peer_cache ("
+        "session_name TEXT NOT NULL, "
+        "username TEXT NOT NULL, "
+        "peer_id INTEGER NOT NULL, "
+        "access_hash INTEGER NOT NULL, "
+        "resolved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, "
+        "PRIMARY KEY (session_name, username))",
+    )),
+    # Сессии, которые уже запускались (вместо first_run.txt)
+    (9, (
+        "CREATE TABLE IF NOT EXISTS recurring_sessions ("
+        "session_name TEXT PRIMARY KEY, "
+        "added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)",
+        _import_first_run_file,
+    )),
+]
+
 
 class ChannelRepository:
-    def __init__(self, db_path: str = "channels.db"):
+    _shared: Dict[str, _SharedConnection] = {}
+    _processed_indexes: Dict[str, _ProcessedGiveawayIndex] = {}
+    _migration_locks: Dict[str, asyncio.Lock] = {}
+    _migrated_paths: Set[str] = set()
+    _MAX_SQL_VARIABLES = 500
+
+    def __init__(
+        self,
+        db_path: str = "channels.db",
+        persistent: Optional[bool] = None
+    ):
         self._db_path = db_path
+        self._persistent = settings.CHANNEL_DB_PERSISTENT_CONNECTION if persistent is None else persistent
+        self._attached = False
+        self._processed_index: Optional[_ProcessedGiveawayIndex] = None
+        if settings.PROCESSED_GIVEAWAYS_INDEX_MAX_SIZE > 0:
+            self._processed_index = self._processed_indexes.setdefault(
+                db_path, _ProcessedGiveawayIndex(settings.PROCESSED_GIVEAWAYS_INDEX_MAX_SIZE)
+            )
 
-    async def initialize(self) -> None:
+    def _get_shared(self) -> _SharedConnection:
+        shared = self._shared.setdefault(self._db_path, _SharedConnection(self._db_path))
+        if not self._attached:
+            shared.users += 1
+            self._attached = True
+        return shared
+
+    @asynccontextmanager
+    async def _connect(self, table: Optional[str] = None) -> AsyncIterator[aiosqlite.Connection]:
+        if self._persistent:
+            shared = self._get_shared()
+            async with shared.lock:
+                yield await shared.get_connection()
+            return
         async with aiosqlite.connect(self._db_path) as db:
-            await db.execute(
-                "CREATE TABLE IF NOT EXISTS subscribed_channels ("
-                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
-                "session_name TEXT NOT NULL, "
-                "channel_name TEXT NOT NULL, "
-                "last_activity_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, "
-                "giveaway_participation_at TIMESTAMP NULL, "
-                "UNIQUE(session_name, channel_name))"
-            )
-            # Новая таблица для обработанных розыгрышей
-            await db.execute(
-                "CREATE TABLE IF NOT EXISTS processed_giveaways ("
-                "giveaway_id TEXT NOT NULL UNIQUE, "
-                "processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
-            )
-            # Новая таблица для ожидающих обработки розыгрышей
-            await db.execute(
-                "CREATE TABLE IF NOT EXISTS pending_giveaways ("
-                "session_name TEXT NOT NULL, "
-                "giveaway_id TEXT NOT NULL, "
-                "giveaway_data TEXT NOT NULL, "
-                "added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, "
-                "PRIMARY KEY (session_name, giveaway_id))"
-            )
-            await db.commit()
-            # Новая таблица для каналов в статусе timeout
-            await db.execute(
-                "CREATE TABLE IF NOT EXISTS channel_timeouts ("
-                "session_name TEXT NOT NULL, "
-                "channel_name TEXT NOT NULL, "
-                "giveaway_id TEXT NOT NULL, "
-                "timeout_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, "
-                "giveaway_end_at TIMESTAMP NOT NULL, "
-                "PRIMARY KEY (session_name, channel_name, giveaway_id))"
-            )
+            await db.execute(f"PRAGMA busy_timeout={int(settings.CHANNEL_DB_BUSY_TIMEOUT_MS)}")
+            yield db
+
+    @asynccontextmanager
+    async def _transaction(self) -> AsyncIterator[aiosqlite.Connection]:
+        if not self._persistent:
+            async with self._connect() as db:
+                yield db
+                await db.commit()
+            return
+        # Не даём чужому commit зафиксировать половину чужой транзакции на общем соединении
+        shared = self._get_shared()
+        async with shared.lock:
+            db = await shared.get_connection()
+            try:
+                yield db
+            except BaseException:
+                await db.rollback()
+                raise
             await db.commit()
 
+    async def _write(self, table: str, sql: str, params: tuple = ()) -> None:
+        """Записывает изменение сразу: в WAL с synchronous=NORMAL commit не ждёт fsync."""
+        async with self._transaction() as db:
+            await db.execute(sql, params)
+
+    async def _write_many(self, table: str, sql: str, params_list: List[tuple]) -> None:
+        # Пачка из одного вызова уходит одной транзакцией
+        if not params_list:
+            return
+        async with self._transaction() as db:
+            await db.executemany(sql, params_list)
+
+    async def _select_existing_ids(self, table: str, sql: str, prefix: tuple, ids: List[str]) -> Set[str]:
+        # sql содержит один "{}" под список плейсхолдеров; ids режем на части из-за лимита переменных SQLite
+        found: Set[str] = set()
+        unique_ids = list(dict.fromkeys(ids))
+        if not unique_ids:
+            return found
+        async with self._connect(table) as db:
+            for start in range(0, len(unique_ids), self._MAX_SQL_VARIABLES):
+                chunk = unique_ids[start:start + self._MAX_SQL_VARIABLES]
+                cursor = await db.execute(sql.format(", ".join("?" * len(chunk))), (*prefix, *chunk))
+                found.update(row[0] for row in await cursor.fetchall())
+                await cursor.close()
+        return found
+
+    async def initialize(self) -> None:
+        await self._migrate()
+        await self._load_processed_index()
+
+    async def _migrate(self) -> None:
+        migration_lock = self._migration_locks.setdefault(self._db_path, asyncio.Lock())
+        async with migration_lock:
+            if self._db_path in self._migrated_paths:
+                return
+            async with self._transaction() as db:
+                await db.execute(
+                    "CREATE TABLE IF NOT EXISTS schema_version ("
+                    "version INTEGER PRIMARY KEY, "
+                    "applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+                )
+            for version, steps in _MIGRATIONS:
+                async with self._transaction() as db:
+                    # BEGIN IMMEDIATE: другой процесс не начнёт ту же миграцию параллельно
+                    await db.execute("BEGIN IMMEDIATE")
+                    cursor = await db.execute("SELECT 1 FROM schema_version WHERE version = ?", (version,))
+                    already_applied = await cursor.fetchone() is not None
+                    await cursor.close()
+                    if already_applied:
+                        continue
+                    for step in steps:
+                        if isinstance(step, str):
+                            await db.execute(step)
+                        else:
+                            await step(db)
+                    await db.execute("INSERT INTO schema_version (version) VALUES (?)", (version,))
+                logger.info(f"channels.db | Applied schema migration {version}")
+            self._migrated_paths.add(self._db_path)
+
+    async def _load_processed_index(self) -> None:
+        index = self._processed_index
+        if index is None or index.loaded:
+            return
+        async with index.load_lock:
+            if index.loaded:
+                return
+            async with self._connect("processed_giveaways") as db:
+                cursor = await db.execute(
+                    "SELECT giveaway_id, CAST(strftime('%s', processed_at) AS INTEGER) "
+                    "FROM processed_giveaways ORDER BY processed_at ASC"
+                )
+                rows = await cursor.fetchall()
+                await cursor.close()
+            index.load([(giveaway_id, float(processed_at or 0)) for giveaway_id, processed_at in rows])
+
     async def is_subscribed(self, session_name: str, channel_name: str) -> bool:
-        async with aiosqlite.connect(self._db_path) as db:
+        async with self._connect("subscribed_channels") as db:
             cursor = await db.execute(
                 "SELECT 1 FROM subscribed_channels WHERE session_name = ? AND channel_name = ?",
                 (session_name, channel_name)
@@ -56,34 +466,31 @@ class ChannelRepository:
             return result is not None
 
     async def add_channel(self, session_name: str, channel_name: str) -> None:
-        async with aiosqlite.connect(self._db_path) as db:
-            await db.execute(
-                "INSERT OR REPLACE INTO subscribed_channels (session_name, channel_name, last_activity_at, giveaway_participation_at) VALUES (?, ?, CURRENT_TIMESTAMP, NULL)",
-                (session_name, channel_name)
-            )
-            await db.commit()
+        await self._write(
+            "subscribed_channels",
+            "INSERT OR REPLACE INTO subscribed_channels (session_name, channel_name, last_activity_at, giveaway_participation_at) VALUES (?, ?, CURRENT_TIMESTAMP, NULL)",
+            (session_name, channel_name)
+        )
 
     async def update_channel_activity(self, session_name: str, channel_name: str) -> None:
-        async with aiosqlite.connect(self._db_path) as db:
-            await db.execute(
-                "UPDATE subscribed_channels SET last_activity_at = CURRENT_TIMESTAMP WHERE session_name = ? AND channel_name = ?",
-                (session_name, channel_name)
-            )
-            await db.commit()
+        await self._write(
+            "subscribed_channels",
+            "UPDATE subscribed_channels SET last_activity_at = CURRENT_TIMESTAMP WHERE session_name = ? AND channel_name = ?",
+            (session_name, channel_name)
+        )
 
     async def update_giveaway_participation_timestamp(
         self, session_name: str, channel_name: str
     ) -> None:
-        async with aiosqlite.connect(self._db_path) as db:
-            await db.execute(
-                "UPDATE subscribed_channels SET giveaway_participation_at = CURRENT_TIMESTAMP WHERE session_name = ? AND channel_name = ?",
-                (session_name, channel_name)
-            )
-            await db.commit()
+        await self._write(
+            "subscribed_channels",
+            "UPDATE subscribed_channels SET giveaway_participation_at = CURRENT_TIMESTAMP WHERE session_name = ? AND channel_name = ?",
+            (session_name, channel_name)
+        )
 
     async def get_channels_to_leave(self, session_name: str, inactivity_hours: int) -> List[Tuple[int, str]]:
         threshold_time = datetime.datetime.now() - datetime.timedelta(hours=inactivity_hours)
-        async with aiosqlite.connect(self._db_path) as db:
+        async with self._connect("subscribed_channels") as db:
             cursor = await db.execute(
                 "SELECT id, channel_name FROM subscribed_channels WHERE session_name = ? AND last_activity_at < ? AND giveaway_participation_at IS NOT NULL",
                 (session_name, threshold_time.strftime('%Y-%m-%d %H:%M:%S'))
@@ -93,26 +500,29 @@ class ChannelRepository:
             return channels_to_leave
 
     async def remove_channel(self, channel_id: int) -> None:
-        async with aiosqlite.connect(self._db_path) as db:
-            await db.execute(
-                "DELETE FROM subscribed_channels WHERE id = ?",
-                (channel_id,)
-            )
-            await db.commit()
+        await self._write(
+            "subscribed_channels",
+            "DELETE FROM subscribed_channels WHERE id = ?",
+            (channel_id,)
+        )
 
     async def add_processed_giveaway(self, giveaway_id: str) -> None:
-        async with aiosqlite.connect(self._db_path) as db:
-            try:
-                await db.execute(
-                    'INSERT INTO processed_giveaways (giveaway_id) VALUES (?)',
-                    (giveaway_id,)
-                )
-                await db.commit()
-            except aiosqlite.IntegrityError:
-                pass
+        if self._processed_index is not None:
+            self._processed_index.add(giveaway_id)
+        await self._write(
+            "processed_giveaways",
+            'INSERT OR IGNORE INTO processed_giveaways (giveaway_id) VALUES (?)',
+            (giveaway_id,)
+        )
 
     async def is_giveaway_processed(self, giveaway_id: str) -> bool:
-        async with aiosqlite.connect(self._db_path) as db:
+        index = self._processed_index
+        if index is not None and index.loaded:
+            if giveaway_id in index:
+                return True
+            if index.complete:
+                return False
+        async with self._connect("processed_giveaways") as db:
             cursor = await db.execute(
                 'SELECT 1 FROM processed_giveaways WHERE giveaway_id = ?',
                 (giveaway_id,)
@@ -121,28 +531,75 @@ class ChannelRepository:
             await cursor.close()
             return row is not None
 
+    async def add_processed_giveaways_many(self, giveaway_ids: List[str]) -> None:
+        if self._processed_index is not None:
+            for giveaway_id in giveaway_ids:
+                self._processed_index.add(giveaway_id)
+        await self._write_many(
+            "processed_giveaways",
+            'INSERT OR IGNORE INTO processed_giveaways (giveaway_id) VALUES (?)',
+            [(giveaway_id,) for giveaway_id in dict.fromkeys(giveaway_ids)]
+        )
+
+    async def get_processed_giveaway_ids(self, giveaway_ids: List[str]) -> Set[str]:
+        """Возвращает подмножество переданных ID, которые уже обработаны."""
+        index = self._processed_index
+        found: Set[str] = set()
+        if index is not None and index.loaded:
+            found = {giveaway_id for giveaway_id in giveaway_ids if giveaway_id in index}
+            if index.complete:
+                return found
+            giveaway_ids = [giveaway_id for giveaway_id in giveaway_ids if giveaway_id not in found]
+        return found | await self._select_existing_ids(
+            "processed_giveaways",
+            'SELECT giveaway_id FROM processed_giveaways WHERE giveaway_id IN ({})',
+            (),
+            giveaway_ids
+        )
+
     async def clear_old_processed_giveaways(self, days_to_keep: int) -> None:
-        async with aiosqlite.connect(self._db_path) as db:
-            await db.execute(
-                '''DELETE FROM processed_giveaways WHERE processed_at < date('now', ?)''',
-                (f'-{days_to_keep} days',)
-            )
-            await db.commit()
+        if self._processed_index is not None:
+            # Та же граница, что и date('now', '-N days'): полночь UTC N дней назад
+            cutoff_date = datetime.datetime.now(datetime.timezone.utc).date() - datetime.timedelta(days=days_to_keep)
+            cutoff = datetime.datetime.combine(cutoff_date, datetime.time(), tzinfo=datetime.timezone.utc)
+            self._processed_index.evict_older_than(cutoff.timestamp())
+        await self._write(
+            "processed_giveaways",
+            '''DELETE FROM processed_giveaways WHERE processed_at < date('now', ?)''',
+            (f'-{days_to_keep} days',)
+        )
+        # Мёртвые записи хранятся столько же, сколько обработанные розыгрыши
+        await self._write(
+            "dead_giveaways",
+            '''DELETE FROM dead_giveaways WHERE dead_at < date('now', ?)''',
+            (f'-{days_to_keep} days',)
+        )
 
     async def add_pending_giveaway(self, session_name: str, giveaway_id: str, giveaway_data: dict) -> None:
-        async with aiosqlite.connect(self._db_path) as db:
-            try:
-                import json
-                await db.execute(
-                    "INSERT INTO pending_giveaways (session_name, giveaway_id, giveaway_data) VALUES (?, ?, ?)",
-                    (session_name, giveaway_id, json.dumps(giveaway_data))
-                )
-                await db.commit()
-            except aiosqlite.IntegrityError:
-                pass
+        await self._write(
+            "pending_giveaways",
+            _PENDING_GIVEAWAY_INSERT,
+            _pending_giveaway_row(session_name, {**giveaway_data, "id": giveaway_id})
+        )
+
+    async def add_pending_giveaways_many(self, session_name: str, giveaways: List[dict]) -> None:
+        await self._write_many(
+            "pending_giveaways",
+            _PENDING_GIVEAWAY_INSERT,
+            [_pending_giveaway_row(session_name, giveaway) for giveaway in giveaways if giveaway.get("id")]
+        )
+
+    async def get_pending_giveaway_ids(self, session_name: str, giveaway_ids: List[str]) -> Set[str]:
+        """Возвращает подмножество переданных ID, которые уже стоят в очереди сессии."""
+        return await self._select_existing_ids(
+            "pending_giveaways",
+            "SELECT giveaway_id FROM pending_giveaways WHERE session_name = ? AND giveaway_id IN ({})",
+            (session_name,),
+            giveaway_ids
+        )
 
     async def is_giveaway_pending(self, session_name: str, giveaway_id: str) -> bool:
-        async with aiosqlite.connect(self._db_path) as db:
+        async with self._connect("pending_giveaways") as db:
             cursor = await db.execute(
                 "SELECT 1 FROM pending_giveaways WHERE session_name = ? AND giveaway_id = ?",
                 (session_name, giveaway_id)
@@ -151,45 +608,269 @@ class ChannelRepository:
             await cursor.close()
             return result is not None
 
-    async def get_pending_giveaways(self, session_name: str) -> List[dict]:
-        async with aiosqlite.connect(self._db_path) as db:
+    async def claim_pending_giveaways(
+        self,
+        session_name: str,
+        worker_id: str,
+        limit: int,
+        lease_seconds: float,
+        max_attempts: int,
+        giveaway_ids: Optional[List[str]] = None
+    ) -> List[PendingGiveaway]:
+        """Атомарно берёт в аренду до limit свободных розыгрышей сессии.
+
+        Розыгрыш свободен, если его никто не арендовал или аренда истекла (например,
+        процесс упал посреди обработки), и он не ждёт перепроверки подписки. attempts
+        считает только неудачи: истёкшую аренду (здесь) и возврат с ошибкой
+        (release_pending_giveaway); записи, исчерпавшие max_attempts, переносятся в
+        dead_giveaways. giveaway_ids ограничивает выборку конкретными розыгрышами.
+        """
+        id_filter = ""
+        id_params: tuple = ()
+        if giveaway_ids is not None:
+            giveaway_ids = giveaway_ids[:self._MAX_SQL_VARIABLES]
+            id_filter = f"AND giveaway_id IN ({', '.join('?' * len(giveaway_ids))}) "
+            id_params = tuple(giveaway_ids)
+        now = time.time()
+        # Розыгрыш, ждущий перепроверки подписки, не выдаётся и не списывается
+        not_parked = (
+            "NOT EXISTS (SELECT 1 FROM validation_rechecks r "
+            "WHERE r.session_name = pending_giveaways.session_name AND r.giveaway_id = pending_giveaways.giveaway_id)"
+        )
+        # Аренда с владельцем, дожившая до выборки, истекла: её владелец упал, это тоже неудача
+        charged_attempts = "attempts + (lease_owner IS NOT NULL)"
+        expired = (
+            f"session_name = ? AND {charged_attempts} >= ? "
+            f"AND (lease_expires_at IS NULL OR lease_expires_at < ?) AND {not_parked}"
+        )
+        async with self._transaction() as db:
+            # BEGIN IMMEDIATE: выборка и аренда идут под блокировкой записи, другой процесс их не перехватит
+            await db.execute("BEGIN IMMEDIATE")
+            await db.execute(
+                "INSERT OR REPLACE INTO dead_giveaways (session_name, giveaway_id, title, payload, attempts, last_error) "
+                f"SELECT session_name, giveaway_id, title, payload, {charged_attempts}, last_error "
+                f"FROM pending_giveaways WHERE {expired}",
+                (session_name, max_attempts, now)
+            )
+            await db.execute(f"DELETE FROM pending_giveaways WHERE {expired}", (session_name, max_attempts, now))
+            cursor = await db.execute(
+                "SELECT giveaway_id, title, channels, validation_status, end_at, payload "
+                "FROM pending_giveaways WHERE session_name = ? AND (lease_expires_at IS NULL OR lease_expires_at < ?) "
+                f"{id_filter}AND {not_parked} "
+                "ORDER BY added_at ASC LIMIT ?",
+                (session_name, now, *id_params, limit)
+            )
+            rows = await cursor.fetchall()
+            await cursor.close()
+            await db.executemany(
+                f"UPDATE pending_giveaways SET lease_owner = ?, lease_expires_at = ?, attempts = {charged_attempts} "
+                "WHERE session_name = ? AND giveaway_id = ?",
+                [(worker_id, now + lease_seconds, session_name, row[0]) for row in rows]
+            )
+        return [_pending_giveaway_from_row(row) for row in rows]
+
+    async def renew_pending_leases(
+        self, session_name: str, worker_id: str, giveaway_ids: List[str], lease_seconds: float
+    ) -> None:
+        await self._write_many(
+            "pending_giveaways",
+            "UPDATE pending_giveaways SET lease_expires_at = ? WHERE session_name = ? AND giveaway_id = ? AND lease_owner = ?",
+            [(time.time() + lease_seconds, session_name, giveaway_id, worker_id) for giveaway_id in giveaway_ids]
+        )
+
+    async def release_pending_giveaway(
+        self, session_name: str, giveaway_id: str, error: Optional[str] = None, retry_delay: float = 0
+    ) -> None:
+        """Возвращает розыгрыш в очередь; снова взять его можно не раньше чем через retry_delay секунд.
+
+        Возврат с error засчитывается как неудачная попытка; без него (отложен до
+        подтверждения подписки, не успели обработать) — нет.
+        """
+        await self._write(
+            "pending_giveaways",
+            "UPDATE pending_giveaways SET lease_owner = NULL, lease_expires_at = ?, last_error = ?, attempts = attempts + ? "
+            "WHERE session_name = ? AND giveaway_id = ?",
+            (time.time() + retry_delay if retry_delay > 0 else None, error, int(error is not None), session_name, giveaway_id)
+        )
+
+    async def get_dead_giveaway_ids(self, session_name: str, giveaway_ids: List[str]) -> Set[str]:
+        """Возвращает подмножество переданных ID, которые сессия отправила в dead_giveaways."""
+        return await self._select_existing_ids(
+            "dead_giveaways",
+            "SELECT giveaway_id FROM dead_giveaways WHERE session_name = ? AND giveaway_id IN ({})",
+            (session_name,),
+            giveaway_ids
+        )
+
+    async def get_pending_giveaways(self, session_name: str) -> List[PendingGiveaway]:
+        async with self._connect("pending_giveaways") as db:
             cursor = await db.execute(
-                "SELECT giveaway_data FROM pending_giveaways WHERE session_name = ? ORDER BY added_at ASC",
+                "SELECT giveaway_id, title, channels, validation_status, end_at, payload "
+                "FROM pending_giveaways WHERE session_name = ? ORDER BY added_at ASC",
                 (session_name,)
             )
             rows = await cursor.fetchall()
             await cursor.close()
-            import json
-            return [json.loads(row[0]) for row in rows]
+            return [_pending_giveaway_from_row(row) for row in rows]
 
     async def remove_pending_giveaway(self, session_name: str, giveaway_id: str) -> None:
-        async with aiosqlite.connect(self._db_path) as db:
-            await db.execute(
-                "DELETE FROM pending_giveaways WHERE session_name = ? AND giveaway_id = ?",
+        await self._write(
+            "pending_giveaways",
+            "DELETE FROM pending_giveaways WHERE session_name = ? AND giveaway_id = ?",
+            (session_name, giveaway_id)
+        )
+
+    async def schedule_validation_recheck(
+        self,
+        session_name: str,
+        giveaway_id: str,
+        channel_name: str,
+        attempt: int,
+        due_at: float,
+        giveaway_end_at: Optional[str] = None
+    ) -> None:
+        await self._write(
+            "validation_rechecks",
+            "INSERT OR REPLACE INTO validation_rechecks "
+            "(session_name, giveaway_id, channel_name, attempt, due_at, giveaway_end_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (session_name, giveaway_id, channel_name, attempt, due_at, giveaway_end_at)
+        )
+
+    async def get_due_validation_rechecks(
+        self, session_name: str, now: float
+    ) -> List[Tuple[str, str, int, Optional[str]]]:
+        """Возвращает (giveaway_id, channel_name, attempt, giveaway_end_at) перепроверок, время которых пришло."""
+        async with self._connect("validation_rechecks") as db:
+            cursor = await db.execute(
+                "SELECT giveaway_id, channel_name, attempt, giveaway_end_at FROM validation_rechecks "
+                "WHERE session_name = ? AND due_at <= ? ORDER BY due_at ASC",
+                (session_name, now)
+            )
+            rows = await cursor.fetchall()
+            await cursor.close()
+            return [tuple(row) for row in rows]
+
+    async def get_next_validation_recheck_at(self, session_name: str) -> Optional[float]:
+        async with self._connect("validation_rechecks") as db:
+            cursor = await db.execute(
+                "SELECT MIN(due_at) FROM validation_rechecks WHERE session_name = ?", (session_name,)
+            )
+            row = await cursor.fetchone()
+            await cursor.close()
+            return row[0] if row else None
+
+    async def has_validation_rechecks(self, session_name: str, giveaway_id: str) -> bool:
+        async with self._connect("validation_rechecks") as db:
+            cursor = await db.execute(
+                "SELECT 1 FROM validation_rechecks WHERE session_name = ? AND giveaway_id = ? LIMIT 1",
                 (session_name, giveaway_id)
             )
-            await db.commit()
+            result = await cursor.fetchone() is not None
+            await cursor.close()
+            return result
+
+    async def remove_validation_recheck(self, session_name: str, giveaway_id: str, channel_name: str) -> None:
+        await self._write(
+            "validation_rechecks",
+            "DELETE FROM validation_rechecks WHERE session_name = ? AND giveaway_id = ? AND channel_name = ?",
+            (session_name, giveaway_id, channel_name)
+        )
+
+    async def remove_validation_rechecks(self, session_name: str, giveaway_id: str) -> None:
+        await self._write(
+            "validation_rechecks",
+            "DELETE FROM validation_rechecks WHERE session_name = ? AND giveaway_id = ?",
+            (session_name, giveaway_id)
+        )
+
+    async def save_giveaway_catalog(self, list_type: str, snapshot: GiveawayCatalogSnapshot) -> None:
+        await self._write(
+            "giveaway_catalog",
+            "INSERT OR REPLACE INTO giveaway_catalog (list_type, fetched_at, payload, newest_id, full_sync_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (
+                list_type,
+                snapshot.fetched_at,
+                zlib.compress(json.dumps(snapshot.items, separators=(",", ":"), ensure_ascii=False).encode()),
+                snapshot.newest_id,
+                snapshot.full_sync_at,
+            )
+        )
+
+    async def get_giveaway_catalog(self, list_type: str) -> Optional[GiveawayCatalogSnapshot]:
+        """Возвращает последний снимок каталога или None."""
+        async with self._connect("giveaway_catalog") as db:
+            cursor = await db.execute(
+                "SELECT fetched_at, payload, newest_id, full_sync_at FROM giveaway_catalog WHERE list_type = ?",
+                (list_type,)
+            )
+            row = await cursor.fetchone()
+            await cursor.close()
+        if row is None:
+            return None
+        fetched_at, payload, newest_id, full_sync_at = row
+        return GiveawayCatalogSnapshot(fetched_at, json.loads(zlib.decompress(payload)), newest_id, full_sync_at or 0.0)
+
+    async def get_cached_peer(self, session_name: str, username: str) -> Optional[Tuple[int, int]]:
+        """Возвращает (peer_id, access_hash) канала, ранее разрешённого этой сессией, или None."""
+        async with self._connect("peer_cache") as db:
+            cursor = await db.execute(
+                "SELECT peer_id, access_hash FROM peer_cache WHERE session_name = ? AND username = ?",
+                (session_name, username.lower())
+            )
+            row = await cursor.fetchone()
+            await cursor.close()
+            return tuple(row) if row else None
+
+    async def save_cached_peer(self, session_name: str, username: str, peer_id: int, access_hash: int) -> None:
+        await self._write(
+            "peer_cache",
+            "INSERT OR REPLACE INTO peer_cache (session_name, username, peer_id, access_hash, resolved_at) "
+            "VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)",
+            (session_name, username.lower(), peer_id, access_hash)
+        )
+
+    async def remove_cached_peer(self, session_name: str, username: str) -> None:
+        await self._write(
+            "peer_cache",
+            "DELETE FROM peer_cache WHERE session_name = ? AND username = ?",
+            (session_name, username.lower())
+        )
+
+    async def is_recurring_session(self, session_name: str) -> bool:
+        async with self._connect("recurring_sessions") as db:
+            cursor = await db.execute(
+                "SELECT 1 FROM recurring_sessions WHERE session_name = ?", (session_name.lower(),)
+            )
+            result = await cursor.fetchone() is not None
+            await cursor.close()
+            return result
+
+    async def add_recurring_session(self, session_name: str) -> None:
+        await self._write(
+            "recurring_sessions",
+            "INSERT OR IGNORE INTO recurring_sessions (session_name) VALUES (?)",
+            (session_name.lower(),)
+        )
 
     async def clear_unparticipated_channels_on_start(
         self, session_name: str
     ) -> None:
-        async with aiosqlite.connect(self._db_path) as db:
-            await db.execute(
-                "DELETE FROM subscribed_channels WHERE session_name = ? AND giveaway_participation_at IS NULL",
-                (session_name,)
-            )
-            await db.commit()
+        await self._write(
+            "subscribed_channels",
+            "DELETE FROM subscribed_channels WHERE session_name = ? AND giveaway_participation_at IS NULL",
+            (session_name,)
+        )
 
     async def mark_channel_timeout(self, session_name: str, channel_name: str, giveaway_id: str, giveaway_end_at: str) -> None:
-        async with aiosqlite.connect(self._db_path) as db:
-            await db.execute(
-                "INSERT OR REPLACE INTO channel_timeouts (session_name, channel_name, giveaway_id, timeout_at, giveaway_end_at) VALUES (?, ?, ?, CURRENT_TIMESTAMP, ?)",
-                (session_name, channel_name, giveaway_id, giveaway_end_at)
-            )
-            await db.commit()
+        await self._write(
+            "channel_timeouts",
+            "INSERT OR REPLACE INTO channel_timeouts (session_name, channel_name, giveaway_id, timeout_at, giveaway_end_at) VALUES (?, ?, ?, CURRENT_TIMESTAMP, ?)",
+            (session_name, channel_name, giveaway_id, giveaway_end_at)
+        )
 
     async def is_channel_timeout(self, session_name: str, channel_name: str, giveaway_id: str) -> bool:
-        async with aiosqlite.connect(self._db_path) as db:
+        async with self._connect("channel_timeouts") as db:
             cursor = await db.execute(
                 "SELECT 1 FROM channel_timeouts WHERE session_name = ? AND channel_name = ? AND giveaway_id = ?",
                 (session_name, channel_name, giveaway_id)
@@ -199,19 +880,36 @@ class ChannelRepository:
             return result is not None
 
     async def remove_channel_timeout(self, session_name: str, channel_name: str, giveaway_id: str) -> None:
-        async with aiosqlite.connect(self._db_path) as db:
-            await db.execute(
-                "DELETE FROM channel_timeouts WHERE session_name = ? AND channel_name = ? AND giveaway_id = ?",
-                (session_name, channel_name, giveaway_id)
-            )
-            await db.commit()
+        await self._write(
+            "channel_timeouts",
+            "DELETE FROM channel_timeouts WHERE session_name = ? AND channel_name = ? AND giveaway_id = ?",
+            (session_name, channel_name, giveaway_id)
+        )
 
     async def clear_expired_timeouts(self) -> None:
-        async with aiosqlite.connect(self._db_path) as db:
-            await db.execute(
-                "DELETE FROM channel_timeouts WHERE giveaway_end_at < CURRENT_TIMESTAMP"
-            )
-            await db.commit()
+        await self._write(
+            "channel_timeouts",
+            "DELETE FROM channel_timeouts WHERE giveaway_end_at < CURRENT_TIMESTAMP"
+        )
 
     async def close(self) -> None:
-        pass 
\ No newline at end of file
+        if not self._attached:
+            return
+        self._attached = False
+        shared = self._shared.get(self._db_path)
+        if shared is None:
+            return
+        shared.users -= 1
+        if shared.users <= 0:
+            self._shared.pop(self._db_path, None)
+            await shared.close()
+
+    @classmethod
+    async def close_all(cls) -> None:
+        """Закрывает все общие соединения процесса."""
+        for db_path, shared in list(cls._shared.items()):
+            cls._shared.pop(db_path, None)
+            try:
+                await shared.close()
+            except Exception as e:
+                logger.error(f"channels.db | Failed to close {db_path}: {e}")
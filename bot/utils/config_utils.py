@@ -1,9 +1,12 @@
 import asyncio
 import json
+import os
+from bot.config import settings
 from bot.utils import logger, log_error, AsyncInterProcessLock
 from opentele.api import API
 from os import path, remove
 from copy import deepcopy
+from typing import Dict, Optional, Set
 
 
 def read_config_file(config_path: str) -> dict:
@@ -17,26 +20,126 @@ def read_config_file(config_path: str) -> dict:
         return {}
 
 
+def _config_lock(config_path: str) -> AsyncInterProcessLock:
+    return AsyncInterProcessLock(path.join(path.dirname(config_path), 'lock_files', 'accounts_config.lock'))
+
+
+def _replace_config_file(content: dict, config_path: str) -> None:
+    # Readers never see a half-written file: write a temp file next to it and swap it in
+    tmp_path = f"{config_path}.tmp"
+    with open(tmp_path, 'w') as file:
+        json.dump(content, file, indent=2)
+    os.replace(tmp_path, config_path)
+
+
 async def write_config_file(content: dict, config_path: str) -> None:
-    lock = AsyncInterProcessLock(path.join(path.dirname(config_path), 'lock_files', 'accounts_config.lock'))
-    async with lock:
-        with open(config_path, 'w+') as file:
-            json.dump(content, file, indent=2)
-        await asyncio.sleep(0.1)
+    async with _config_lock(config_path):
+        _replace_config_file(content, config_path)
+    store = AccountsConfigStore.loaded(config_path)
+    if store is not None:
+        store.reset(content)
+
+
+class AccountsConfigStore:
+    """In-memory copy of accounts_config.json shared by the whole process.
+
+    The file is read once; reads are served from memory. Session updates are
+    coalesced and written after ACCOUNTS_CONFIG_FLUSH_DELAY seconds in one atomic
+    write. Before writing, the file is re-read under the lock and only the
+    sessions changed here are applied on top, so edits by other processes survive.
+    """
+
+    _stores: Dict[str, 'AccountsConfigStore'] = {}
+
+    def __init__(self, config_path: str):
+        self._config_path = config_path
+        self._config: dict = read_config_file(config_path)
+        self._dirty: Set[str] = set()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def get(cls, config_path: str) -> 'AccountsConfigStore':
+        store = cls._stores.get(config_path)
+        if store is None:
+            store = cls._stores[config_path] = cls(config_path)
+        return store
+
+    @classmethod
+    def loaded(cls, config_path: str) -> Optional['AccountsConfigStore']:
+        return cls._stores.get(config_path)
+
+    @property
+    def config(self) -> dict:
+        """The whole config. Must not be modified in place: use update_session_config."""
+        return self._config
+
+    def get_session_config(self, session_name: str) -> dict:
+        return deepcopy(self._config.get(session_name, {}))
+
+    def update_session_config(self, session_name: str, session_config: dict) -> None:
+        self._config[session_name] = deepcopy(session_config)
+        self._dirty.add(session_name)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    def reset(self, content: dict) -> None:
+        """Replaces the in-memory copy after the file was rewritten as a whole."""
+        self._config = deepcopy(content)
+        self._dirty.clear()
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(settings.ACCOUNTS_CONFIG_FLUSH_DELAY)
+        try:
+            await self.flush()
+        except Exception as e:
+            log_error(f"Failed to save accounts config `{self._config_path}`: {e}")
+        # Updates made while this task was flushing did not schedule a flush of their own
+        if self._dirty:
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def flush(self) -> None:
+        if not self._dirty:
+            return
+        async with _config_lock(self._config_path):
+            dirty, self._dirty = self._dirty, set()
+            changes = {session_name: self._config[session_name] for session_name in dirty}
+            try:
+                config = read_config_file(self._config_path)
+                config.update(changes)
+                _replace_config_file(config, self._config_path)
+            except BaseException:
+                self._dirty |= dirty
+                raise
+        # Sessions added by other processes become visible too; sessions updated here
+        # while the file was being written are dirty again and keep their newer value
+        for session_name, session_config in config.items():
+            if session_name not in self._dirty:
+                self._config[session_name] = session_config
+
+    async def close(self) -> None:
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush()
+
+    @classmethod
+    async def close_all(cls) -> None:
+        for store in list(cls._stores.values()):
+            try:
+                await store.close()
+            except Exception as e:
+                log_error(f"Failed to save accounts config `{store._config_path}`: {e}")
 
 
 def get_session_config(session_name: str, config_path: str) -> dict:
-    return read_config_file(config_path).get(session_name, {})
+    return AccountsConfigStore.get(config_path).get_session_config(session_name)
 
 
 async def update_session_config_in_file(session_name: str, updated_session_config: dict, config_path: str) -> None:
-    config = read_config_file(config_path)
-    config[session_name] = updated_session_config
-    await write_config_file(config, config_path)
+    AccountsConfigStore.get(config_path).update_session_config(session_name, updated_session_config)
 
 
 async def restructure_config(config_path: str) -> None:
-    config = read_config_file(config_path)
+    config = AccountsConfigStore.get(config_path).config
     if config:
         cfg_copy = deepcopy(config)
         for key, value in cfg_copy.items():
@@ -1,12 +1,44 @@
-import aiofiles
+import asyncio
+from typing import Optional, Set
+
+from bot.utils.channel_repository import ChannelRepository
+
+# Sessions known to have run before. Only positive answers are cached: a session
+# missing here is looked up in the recurring_sessions table, which other processes
+# sharing channels.db may have filled in meanwhile.
+_recurring_sessions: Set[str] = set()
+_repository: Optional[ChannelRepository] = None
+_repository_lock: Optional[asyncio.Lock] = None
+
+
+async def _get_repository() -> ChannelRepository:
+    global _repository, _repository_lock
+    if _repository is None:
+        if _repository_lock is None:
+            _repository_lock = asyncio.Lock()
+        async with _repository_lock:
+            if _repository is None:
+                repository = ChannelRepository()
+                await repository.initialize()
+                _repository = repository
+    return _repository
+
 
 async def check_is_first_run(session_name: str):
-    async with aiofiles.open('first_run.txt', mode='a+') as file:
-        await file.seek(0)
-        lines = await file.readlines()
-    return session_name.lower() not in [line.strip() for line in lines]
+    name = session_name.lower()
+    if name in _recurring_sessions:
+        return False
+    repository = await _get_repository()
+    if await repository.is_recurring_session(name):
+        _recurring_sessions.add(name)
+        return False
+    return True
 
 
 async def append_recurring_session(session_name: str):
-    async with aiofiles.open('first_run.txt', mode='a+') as file:
-        await file.writelines(session_name.lower() + '\n')
+    name = session_name.lower()
+    if name in _recurring_sessions:
+        return
+    _recurring_sessions.add(name)
+    repository = await _get_repository()
+    await repository.add_recurring_session(name)
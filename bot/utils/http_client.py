@@ -0,0 +1,77 @@
+import asyncio
+import ssl
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import aiohttp
+from aiohttp_proxy import ProxyConnector
+
+from bot.config import settings
+from bot.utils import logger
+
+
+class HttpClientRegistry:
+    """Process-wide pool of aiohttp sessions keyed by (proxy, host).
+
+    Every caller talking to the same host through the same proxy shares one
+    session, so keep-alive connections stay warm across sessions instead of
+    paying a TCP and TLS handshake per bot. All connectors share one SSL context.
+    """
+
+    _sessions: Dict[Tuple[Optional[str], str], aiohttp.ClientSession] = {}
+    _lock: Optional[asyncio.Lock] = None
+    _ssl_context: Optional[ssl.SSLContext] = None
+
+    @classmethod
+    def _get_ssl_context(cls) -> ssl.SSLContext:
+        # Loading the CA bundle is the expensive part of building a context, do it once
+        if cls._ssl_context is None:
+            cls._ssl_context = ssl.create_default_context()
+        return cls._ssl_context
+
+    @classmethod
+    def create_connector(cls, proxy: Optional[str] = None) -> aiohttp.TCPConnector:
+        connector_kwargs = dict(
+            ssl=cls._get_ssl_context(),
+            limit=settings.HTTP_POOL_LIMIT,
+            limit_per_host=settings.HTTP_POOL_LIMIT_PER_HOST,
+            keepalive_timeout=settings.HTTP_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=settings.HTTP_DNS_CACHE_TTL,
+        )
+        if proxy:
+            return ProxyConnector.from_url(proxy, **connector_kwargs)
+        return aiohttp.TCPConnector(**connector_kwargs)
+
+    @classmethod
+    async def get_session(cls, url: str, proxy: Optional[str] = None) -> aiohttp.ClientSession:
+        """Returns the shared session for the host of url, routed through proxy if given.
+
+        Sessions are owned by the registry: callers must not close them. Cookies are
+        not kept, since one session serves many accounts.
+        """
+        key = (proxy or None, urlsplit(url).netloc or url)
+        session = cls._sessions.get(key)
+        if session is not None and not session.closed:
+            return session
+
+        if cls._lock is None:
+            cls._lock = asyncio.Lock()
+        async with cls._lock:
+            session = cls._sessions.get(key)
+            if session is None or session.closed:
+                session = aiohttp.ClientSession(
+                    connector=cls.create_connector(proxy),
+                    timeout=aiohttp.ClientTimeout(settings.HTTP_REQUEST_TIMEOUT),
+                    cookie_jar=aiohttp.DummyCookieJar(),
+                )
+                cls._sessions[key] = session
+        return session
+
+    @classmethod
+    async def close_all(cls) -> None:
+        sessions, cls._sessions = cls._sessions, {}
+        for session in sessions.values():
+            try:
+                await session.close()
+            except Exception as e:
+                logger.warning(f"Failed to close HTTP session: {e}")
@@ -0,0 +1,57 @@
+import json
+import os
+import re
+import time
+from typing import Optional
+
+import aiofiles
+
+from bot.utils import logger, SESSIONS_PATH
+
+INIT_DATA_DIR = os.path.join(SESSIONS_PATH, 'init_data')
+
+
+def _cache_path(session_name: str) -> str:
+    return os.path.join(INIT_DATA_DIR, f"{session_name}.json")
+
+
+def get_auth_date(init_data: str) -> Optional[int]:
+    match = re.search(r'(?:^|&)auth_date=(\d+)', init_data)
+    return int(match.group(1)) if match else None
+
+
+async def get_cached_init_data(session_name: str, max_age: float) -> Optional[str]:
+    """Returns the session's cached tgWebAppData if its auth_date is younger than max_age seconds."""
+    if max_age <= 0:
+        return None
+    try:
+        async with aiofiles.open(_cache_path(session_name), 'r') as file:
+            cached = json.loads(await file.read())
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"{session_name} | Failed to read cached init data: {e}")
+        return None
+
+    auth_date = cached.get('auth_date')
+    if not isinstance(auth_date, (int, float)) or time.time() - auth_date >= max_age:
+        return None
+    return cached.get('init_data')
+
+
+async def save_init_data(session_name: str, init_data: str) -> None:
+    auth_date = get_auth_date(init_data)
+    if auth_date is None:
+        return
+    os.makedirs(INIT_DATA_DIR, exist_ok=True)
+    tmp_path = _cache_path(session_name) + '.tmp'
+    async with aiofiles.open(tmp_path, 'w') as file:
+        await file.write(json.dumps({'auth_date': auth_date, 'init_data': init_data}))
+    os.replace(tmp_path, _cache_path(session_name))
+
+
+def drop_init_data(session_name: str) -> None:
+    try:
+        os.remove(_cache_path(session_name))
+    except FileNotFoundError:
+        pass
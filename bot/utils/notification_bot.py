@@ -1,9 +1,8 @@
 import aiohttp
-import asyncio
-from typing import Optional
 
 from bot.config.config import settings
 from bot.utils import logger
+from bot.utils.http_client import HttpClientRegistry
 
 
 class NotificationBot:
@@ -13,13 +12,10 @@ class NotificationBot:
         self._bot_token = bot_token
         self._chat_id = chat_id
         self._base_url = f"https://api.telegram.org/bot{self._bot_token}"
-        self._http_client: Optional[aiohttp.ClientSession] = None
 
     async def _get_http_client(self) -> aiohttp.ClientSession:
-        """Возвращает существующий или создает новый HTTP клиент."""
-        if self._http_client is None or self._http_client.closed:
-            self._http_client = aiohttp.ClientSession()
-        return self._http_client
+        """Возвращает общий HTTP клиент для api.telegram.org."""
+        return await HttpClientRegistry.get_session(self._base_url)
 
     async def send_message(self, message: str) -> None:
         """Отправляет сообщение в указанный чат."""
@@ -60,9 +56,7 @@ class NotificationBot:
         return escaped_text
 
     async def close(self) -> None:
-        """Закрывает HTTP клиент."""
-        if self._http_client and not self._http_client.closed:
-            await self._http_client.close()
+        """Ничего не закрывает: HTTP сессиями владеет HttpClientRegistry."""
 
     async def отправить_уведомление_о_запуске(self) -> None:
         """Отправляет сообщение о запуске программы."""
@@ -0,0 +1,300 @@
+import asyncio
+import heapq
+import json
+import os
+import time
+from collections import Counter
+from random import shuffle
+from typing import Dict, List, Optional, Set, Tuple
+
+from bot.config import settings
+from bot.utils import logger, proxy_utils
+from bot.utils.proxy_probe import LocalEchoServer
+
+
+class _ProxyHealth:
+    """Check history of one proxy: exponentially weighted latency and success rate."""
+
+    __slots__ = ("latency", "success_rate", "alive", "checked_at", "version")
+
+    _ALPHA = 0.3
+
+    def __init__(self):
+        self.latency: Optional[float] = None
+        self.success_rate = 1.0
+        self.alive: Optional[bool] = None
+        self.checked_at = 0.0
+        # Bumped on every check so heap entries with an outdated score can be recognised
+        self.version = 0
+
+    def record(self, alive: bool, latency: float) -> None:
+        self.alive = alive
+        self.checked_at = time.time()
+        self.version += 1
+        self.success_rate += self._ALPHA * ((1.0 if alive else 0.0) - self.success_rate)
+        if alive:
+            self.latency = latency if self.latency is None else self.latency + self._ALPHA * (latency - self.latency)
+
+    @property
+    def score(self) -> float:
+        # Lower is better: slow or flaky proxies sink
+        return (self.latency or 0.0) / max(self.success_rate, 0.01)
+
+    def is_fresh(self, ttl: float) -> bool:
+        return self.alive is not None and time.time() - self.checked_at < ttl
+
+    def to_dict(self) -> dict:
+        return {
+            'alive': self.alive,
+            'latency': self.latency,
+            'success_rate': self.success_rate,
+            'checked_at': self.checked_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> '_ProxyHealth':
+        health = cls()
+        health.alive = data.get('alive')
+        health.latency = data.get('latency')
+        health.success_rate = data.get('success_rate', 1.0)
+        health.checked_at = data.get('checked_at', 0.0)
+        return health
+
+
+class ProxyPool:
+    """Proxies from proxies.txt with health scores, shared by the whole process.
+
+    The file is read once and re-read only when its modification time changes.
+    Proxies are checked concurrently (at most PROXY_CHECK_CONCURRENCY at a time);
+    alive proxies sit in a heap ordered by score, so the best one that still has
+    room for another session (SESSIONS_PER_PROXY) is handed out in O(log n).
+    With start(), all proxies are re-checked every PROXY_RECHECK_INTERVAL seconds.
+
+    Check results are saved to proxy_health.json next to the proxies file; results
+    younger than PROXY_HEALTH_CACHE_TTL are reused instead of probing again, also
+    by the next launch.
+    """
+
+    _pools: Dict[str, 'ProxyPool'] = {}
+
+    def __init__(self, proxy_path: str):
+        self._proxy_path = proxy_path
+        self._health_path = os.path.join(os.path.dirname(proxy_path), 'proxy_health.json')
+        self._mtime: Optional[float] = None
+        self._proxies: List[str] = []
+        self._listed: Set[str] = set()
+        self._health: Dict[str, _ProxyHealth] = {}
+        self._heap: List[Tuple[float, int, str]] = []
+        self._usage: Counter = Counter()
+        self._check_lock = asyncio.Lock()
+        self._save_lock = asyncio.Lock()
+        self._recheck_task: Optional[asyncio.Task] = None
+        self._load_health()
+        self._reload_if_changed()
+
+    @classmethod
+    def get(cls, proxy_path: str) -> 'ProxyPool':
+        pool = cls._pools.get(proxy_path)
+        if pool is None:
+            pool = cls._pools[proxy_path] = cls(proxy_path)
+        return pool
+
+    @property
+    def proxies(self) -> List[str]:
+        self._reload_if_changed()
+        return self._proxies
+
+    def _reload_if_changed(self) -> None:
+        try:
+            mtime = os.stat(self._proxy_path).st_mtime
+        except OSError:
+            mtime = None
+        if mtime is not None and mtime == self._mtime:
+            return
+        self._mtime = mtime
+        self._proxies = proxy_utils.get_proxies(self._proxy_path)
+        self._listed = set(self._proxies)
+        # Proxies removed from the file keep their health while sessions still use them; release() prunes them
+        health = {proxy: h for proxy, h in self._health.items() if self._usage[proxy] > 0}
+        self._health = {**health, **{proxy: self._health.get(proxy) or _ProxyHealth() for proxy in self._proxies}}
+        self._rebuild_heap()
+
+    def _load_health(self) -> None:
+        try:
+            with open(self._health_path, 'r') as file:
+                cached = json.load(file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Proxy pool | Failed to read `{self._health_path}`: {e}")
+            return
+        for proxy, data in cached.items():
+            health = _ProxyHealth.from_dict(data)
+            if health.is_fresh(settings.PROXY_HEALTH_CACHE_TTL):
+                self._health[proxy] = health
+
+    async def _save_health(self) -> None:
+        # Only results that a later launch could still trust are worth keeping
+        content = {
+            proxy: health.to_dict() for proxy, health in self._health.items()
+            if health.is_fresh(settings.PROXY_HEALTH_CACHE_TTL)
+        }
+        # Writes share one tmp file, so they go one at a time and off the event loop
+        async with self._save_lock:
+            await asyncio.to_thread(self._write_health, content)
+
+    def _write_health(self, content: dict) -> None:
+        tmp_path = f"{self._health_path}.tmp"
+        try:
+            with open(tmp_path, 'w') as file:
+                json.dump(content, file)
+            os.replace(tmp_path, self._health_path)
+        except OSError as e:
+            logger.warning(f"Proxy pool | Failed to save `{self._health_path}`: {e}")
+
+    def _rebuild_heap(self) -> None:
+        self._heap = [
+            (health.score, health.version, proxy)
+            for proxy, health in self._health.items() if health.alive and self._can_hand_out(proxy)
+        ]
+        heapq.heapify(self._heap)
+
+    def _push(self, proxy: str) -> None:
+        health = self._health.get(proxy)
+        if health is not None and health.alive and self._can_hand_out(proxy):
+            heapq.heappush(self._heap, (health.score, health.version, proxy))
+
+    def _has_capacity(self, proxy: str) -> bool:
+        return self._usage[proxy] < settings.SESSIONS_PER_PROXY
+
+    def _can_hand_out(self, proxy: str) -> bool:
+        # Proxies gone from the file are only tracked for the sessions still using them
+        return proxy in self._listed and self._has_capacity(proxy)
+
+    def set_usage(self, accounts_config: dict) -> None:
+        """Counts sessions per proxy from the accounts config."""
+        self._usage = Counter(v.get('proxy') for v in accounts_config.values() if v.get('proxy'))
+        self._rebuild_heap()
+
+    def assign(self, proxy: str) -> None:
+        self._usage[proxy] += 1
+
+    def release(self, proxy: str) -> None:
+        if self._usage[proxy] > 0:
+            self._usage[proxy] -= 1
+            if self._usage[proxy] == 0 and proxy not in self._listed:
+                self._health.pop(proxy, None)
+                return
+            self._push(proxy)
+
+    def is_alive(self, proxy: str) -> bool:
+        health = self._health.get(proxy)
+        return bool(health and health.alive)
+
+    def stats(self, proxy: str) -> Optional[dict]:
+        health = self._health.get(proxy)
+        if health is None:
+            return None
+        return {
+            'alive': health.alive,
+            'latency': health.latency,
+            'success_rate': health.success_rate,
+            'checked_at': health.checked_at,
+            'sessions': self._usage[proxy],
+        }
+
+    async def check(self, proxies: Optional[List[str]] = None, force: bool = False) -> Dict[str, bool]:
+        """Checks proxies (all of them by default) concurrently and updates their scores.
+
+        Proxies checked less than PROXY_HEALTH_CACHE_TTL seconds ago keep their result unless force is set.
+        """
+        self._reload_if_changed()
+        proxies = list(self._proxies if proxies is None else proxies)
+        semaphore = asyncio.Semaphore(settings.PROXY_CHECK_CONCURRENCY)
+
+        async def check_one(proxy: str) -> bool:
+            health = self._health.get(proxy)
+            if not force and health is not None and health.is_fresh(settings.PROXY_HEALTH_CACHE_TTL):
+                return health.alive
+            async with semaphore:
+                started = time.monotonic()
+                alive = await proxy_utils.probe_proxy(proxy)
+                # Proxies assigned in accounts_config may be missing from proxies.txt
+                self._health.setdefault(proxy, _ProxyHealth()).record(alive, time.monotonic() - started)
+                self._push(proxy)
+                return alive
+
+        results = await asyncio.gather(*(check_one(proxy) for proxy in proxies))
+        await self._save_health()
+        return dict(zip(proxies, results))
+
+    def acquire(self) -> Optional[str]:
+        """Returns the best alive proxy with room for another session and counts the session, or None."""
+        self._reload_if_changed()
+        while self._heap:
+            _, version, proxy = self._heap[0]
+            health = self._health.get(proxy)
+            if health is None or not health.alive or health.version != version or not self._can_hand_out(proxy):
+                # Outdated entry: the proxy was re-checked, removed or filled up
+                heapq.heappop(self._heap)
+                continue
+            self.assign(proxy)
+            if not self._has_capacity(proxy):
+                heapq.heappop(self._heap)
+            return proxy
+        return None
+
+    async def acquire_working(self) -> Optional[str]:
+        """Like acquire, but checks proxies without a fresh result in waves of PROXY_CHECK_CONCURRENCY until one is found."""
+        async with self._check_lock:
+            proxy = self.acquire()
+            if proxy is not None:
+                return proxy
+            candidates = [
+                proxy for proxy in self.proxies
+                if not self._health[proxy].is_fresh(settings.PROXY_HEALTH_CACHE_TTL) and self._has_capacity(proxy)
+            ]
+            shuffle(candidates)
+            while candidates:
+                wave = candidates[:settings.PROXY_CHECK_CONCURRENCY]
+                candidates = candidates[settings.PROXY_CHECK_CONCURRENCY:]
+                await self.check(wave)
+                proxy = self.acquire()
+                if proxy is not None:
+                    return proxy
+            return None
+
+    def acquire_unchecked(self) -> Optional[str]:
+        """Returns the first proxy of the file with room for another session without checking it."""
+        proxy = next((proxy for proxy in self.proxies if self._has_capacity(proxy)), None)
+        if proxy is not None:
+            self.assign(proxy)
+        return proxy
+
+    def start(self) -> None:
+        """Starts background re-checks of all proxies."""
+        if settings.PROXY_RECHECK_INTERVAL > 0 and (self._recheck_task is None or self._recheck_task.done()):
+            self._recheck_task = asyncio.create_task(self._recheck_forever())
+
+    async def _recheck_forever(self) -> None:
+        while True:
+            await asyncio.sleep(settings.PROXY_RECHECK_INTERVAL)
+            try:
+                async with self._check_lock:
+                    results = await self.check(force=True)
+                logger.info(f"Proxy pool | {sum(results.values())}/{len(results)} proxies alive")
+            except Exception as e:
+                logger.warning(f"Proxy pool | Re-check failed: {e}")
+
+    async def close(self) -> None:
+        if self._recheck_task is not None:
+            self._recheck_task.cancel()
+            self._recheck_task = None
+
+    @classmethod
+    async def close_all(cls) -> None:
+        for pool in list(cls._pools.values()):
+            await pool.close()
+        # A later get() must build a fresh pool instead of returning a closed one
+        cls._pools.clear()
+        await LocalEchoServer.close()
@@ -0,0 +1,126 @@
+import asyncio
+from typing import List, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+from python_socks.sync import Proxy as SyncProxy
+
+from bot.config import settings
+from bot.utils import logger
+
+LOCAL_TARGET = 'local'
+_ECHO_PAYLOAD = b'mrkt-proxy-probe\n'
+
+
+class LocalEchoServer:
+    """Tiny TCP echo server on 127.0.0.1, the `local` probe target.
+
+    Only useful with proxies that can reach this machine (tests, local proxies):
+    the probe tunnels to it through the proxy and expects its payload back.
+    """
+
+    _server: Optional[asyncio.AbstractServer] = None
+    _port: Optional[int] = None
+    _lock: Optional[asyncio.Lock] = None
+
+    @classmethod
+    async def get_address(cls) -> tuple[str, int]:
+        if cls._server is None:
+            if cls._lock is None:
+                cls._lock = asyncio.Lock()
+            async with cls._lock:
+                if cls._server is None:
+                    server = await asyncio.start_server(cls._handle, '127.0.0.1', 0)
+                    cls._port = server.sockets[0].getsockname()[1]
+                    cls._server = server
+                    logger.info(f"Local proxy probe server listening on 127.0.0.1:{cls._port}")
+        return '127.0.0.1', cls._port
+
+    @staticmethod
+    async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            writer.write(await reader.readline())
+            await writer.drain()
+        finally:
+            writer.close()
+
+    @classmethod
+    async def close(cls) -> None:
+        if cls._server is not None:
+            server, cls._server = cls._server, None
+            server.close()
+            await server.wait_closed()
+
+
+def get_probe_targets() -> List[str]:
+    return [target.strip() for target in settings.PROXY_PROBE_TARGETS.split(',') if target.strip()]
+
+
+def _tunnel(proxy: str, host: str, port: int, payload: Optional[bytes], timeout: float) -> bool:
+    # python_socks speaks CONNECT for http proxies and the handshake for socks4/socks5
+    proxy_url = 'http' + proxy[len('https'):] if proxy.startswith('https://') else proxy
+    sock = SyncProxy.from_url(proxy_url).connect(dest_host=host, dest_port=port, timeout=timeout)
+    try:
+        if payload is None:
+            return True
+        sock.settimeout(timeout)
+        sock.sendall(payload)
+        received = b''
+        while len(received) < len(payload):
+            chunk = sock.recv(len(payload) - len(received))
+            if not chunk:
+                break
+            received += chunk
+        return received == payload
+    finally:
+        sock.close()
+
+
+async def _probe_tcp(proxy: str, host: str, port: int, payload: Optional[bytes] = None) -> bool:
+    try:
+        return await asyncio.to_thread(_tunnel, proxy, host, port, payload, settings.PROXY_PROBE_TIMEOUT)
+    except Exception:
+        return False
+
+
+async def _probe_http(proxy: str, url: str) -> Optional[str]:
+    from bot.utils.http_client import HttpClientRegistry
+
+    # A probe is one request per proxy and target: a short-lived session, not a pooled one per (proxy, host)
+    try:
+        async with aiohttp.ClientSession(
+            connector=HttpClientRegistry.create_connector(proxy),
+            timeout=aiohttp.ClientTimeout(settings.PROXY_PROBE_TIMEOUT),
+            cookie_jar=aiohttp.DummyCookieJar(),
+        ) as session:
+            async with session.get(url) as response:
+                if response.status == 200:
+                    return await response.text()
+    except Exception:
+        pass
+    return None
+
+
+async def probe(proxy: str) -> Optional[str]:
+    """Tries the probe targets in order until one answers through the proxy.
+
+    Returns the response body of an HTTP target ('' for TCP targets) or None if
+    no target could be reached. Targets:
+      - http(s)://... — GET through the proxy, 200 means alive;
+      - tcp://host:port — only opens a tunnel (CONNECT / SOCKS) to host:port;
+      - local — tunnels to the built-in LocalEchoServer and checks the echo.
+    """
+    for target in get_probe_targets():
+        if target == LOCAL_TARGET:
+            host, port = await LocalEchoServer.get_address()
+            if await _probe_tcp(proxy, host, port, _ECHO_PAYLOAD):
+                return ''
+        elif target.startswith('tcp://'):
+            address = urlsplit(target)
+            if address.hostname and address.port and await _probe_tcp(proxy, address.hostname, address.port):
+                return ''
+        else:
+            body = await _probe_http(proxy, target)
+            if body is not None:
+                return body
+    return None
@@ -1,13 +1,10 @@
 import os
-import aiohttp
-from aiohttp_proxy import ProxyConnector
 from collections import Counter
 from python_socks import ProxyType
 from shutil import copyfile
 from better_proxy import Proxy
 from bot.config import settings
 from bot.utils import logger
-from random import shuffle
 
 PROXY_TYPES = {
     'socks5': ProxyType.SOCKS5,
@@ -61,20 +58,28 @@ def get_unused_proxies(accounts_config: dict, proxy_path: str) -> list[str]:
     return [proxy for proxy in all_proxies if proxies_count.get(proxy, 0) < settings.SESSIONS_PER_PROXY]
 
 
+async def _probe(proxy: str) -> str | None:
+    # Shared HTTP sessions behind the proxy are left alone: running bots may still use them
+    from bot.utils.proxy_probe import probe
+
+    return await probe(proxy)
+
+
+async def probe_proxy(proxy: str) -> bool:
+    """Checks the proxy against PROXY_PROBE_TARGETS without logging the result."""
+    return await _probe(proxy) is not None
+
+
 async def check_proxy(proxy: str) -> bool:
-    url = 'https://ifconfig.me/ip'
-    proxy_conn = ProxyConnector.from_url(proxy)
-    try:
-        async with aiohttp.ClientSession(connector=proxy_conn, timeout=aiohttp.ClientTimeout(15)) as session:
-            response = await session.get(url)
-            if response.status == 200:
-                logger.success(f"Successfully connected to proxy. IP: {await response.text()}")
-                if not proxy_conn.closed:
-                    proxy_conn.close()
-                return True
-    except Exception:
-        logger.warning(f"Proxy {proxy} didn't respond")
-        return False
+    result = await _probe(proxy)
+    if result:
+        logger.success(f"Successfully connected to proxy. IP: {result.strip()}")
+        return True
+    if result is not None:
+        logger.success(f"Successfully connected to proxy {proxy}")
+        return True
+    logger.warning(f"Proxy {proxy} didn't respond")
+    return False
 
 
 async def get_proxy_chain(path: str) -> tuple[str | None, str | None]:
@@ -88,14 +93,12 @@ async def get_proxy_chain(path: str) -> tuple[str | None, str | None]:
 
 
 async def get_working_proxy(accounts_config: dict, current_proxy: str | None) -> str | None:
+    from bot.utils import PROXIES_PATH
+    from bot.utils.proxy_pool import ProxyPool
+
     if current_proxy and await check_proxy(current_proxy):
         return current_proxy
 
-    from bot.utils import PROXIES_PATH
-    unused_proxies = get_unused_proxies(accounts_config, PROXIES_PATH)
-    shuffle(unused_proxies)
-    for proxy in unused_proxies:
-        if await check_proxy(proxy):
-            return proxy
-
-    return None
+    pool = ProxyPool.get(PROXIES_PATH)
+    pool.set_usage(accounts_config)
+    return await pool.acquire_working()
@@ -1,10 +1,11 @@
 import asyncio
 import os
+import time
 from better_proxy import Proxy
 from datetime import datetime, timedelta
 from random import randint, uniform
 from sqlite3 import OperationalError
-from typing import Union
+from typing import Awaitable, Callable, Dict, Optional, Tuple, Union
 
 from opentele.tl import TelegramClient
 from telethon.errors import *
@@ -24,8 +25,12 @@ from pyrogram.raw import types as ptypes
 from bot.config import settings
 from bot.exceptions import InvalidSession
 from bot.utils.proxy_utils import to_pyrogram_proxy, to_telethon_proxy
+from bot.utils.channel_repository import ChannelRepository
 from bot.utils import logger, log_error, AsyncInterProcessLock, CONFIG_PATH, first_run
 
+# Errors meaning a cached access hash no longer matches the username
+_STALE_PEER_ERRORS = (ChannelInvalid, ChannelInvalidError, PeerIdInvalid, PeerIdInvalidError)
+
 
 class UniversalTelegramClient:
     def __init__(self, **client_params):
@@ -41,6 +46,21 @@ class UniversalTelegramClient:
             os.path.join(os.path.dirname(CONFIG_PATH), 'lock_files', f"{self.session_name}.lock"))
         self._webview_data = None
         self.ref_id = settings.REF_ID if randint(1, 100) <= 70 else '252453226'
+        # Persistent mode keeps one MTProto connection open until it has been idle for TG_IDLE_TIMEOUT
+        self._persistent_connection: bool = settings.TG_PERSISTENT_CONNECTION
+        self._active_operations = 0
+        self._last_used = 0.0
+        # Serialises the refcount changes with connect/disconnect so concurrent calls share one connection
+        self._connection_lock = asyncio.Lock()
+        self._idle_disconnect_task: Optional[asyncio.Task] = None
+        # username -> (channel id, access hash); backed by the peer_cache table so restarts skip ResolveUsername too
+        self._peer_cache: Dict[str, Tuple[int, int]] = {}
+        self._peer_repository: Optional[ChannelRepository] = None
+        self._peer_repository_ready = False
+        # Joined channels waiting to be archived in one batch, by channel id
+        self._pending_archive: Dict[int, object] = {}
+        self._archive_queued_at: Optional[float] = None
+        self._archive_flush_task: Optional[asyncio.Task] = None
 
     def _init_client(self):
         try:
@@ -69,6 +89,140 @@ class UniversalTelegramClient:
             self.proxy = to_pyrogram_proxy(proxy)
             self.client.proxy = self.proxy
 
+    def _is_connected(self) -> bool:
+        # Pyrogram exposes is_connected as a property, Telethon as a method
+        return self.client.is_connected if self.is_pyrogram else self.client.is_connected()
+
+    async def _acquire_connection(self) -> None:
+        """Marks an operation as started and connects if needed.
+
+        A batch of channels to archive that has waited TG_ARCHIVE_BATCH_WINDOW seconds
+        goes out over this connection. Must be paired with _release_connection, even if
+        connecting fails.
+        """
+        async with self._connection_lock:
+            self._active_operations += 1
+            self._last_used = time.monotonic()
+            if not self._is_connected():
+                await self.client.connect()
+            if self._archive_batch_due():
+                await self._send_archive_batch()
+
+    async def _release_connection(self, pause: float = 0) -> None:
+        """Marks an operation as finished.
+
+        Without persistent mode the last operation disconnects and waits pause seconds;
+        in persistent mode the connection stays open for the next call.
+        """
+        async with self._connection_lock:
+            self._active_operations -= 1
+            self._last_used = time.monotonic()
+            if self._persistent_connection:
+                if self._idle_disconnect_task is None or self._idle_disconnect_task.done():
+                    self._idle_disconnect_task = asyncio.create_task(self._disconnect_when_idle())
+                return
+            if self._active_operations or not self._is_connected():
+                return
+            await self.client.disconnect()
+        if pause:
+            await asyncio.sleep(pause)
+
+    async def _disconnect_when_idle(self) -> None:
+        idle_timeout = settings.TG_IDLE_TIMEOUT
+        while True:
+            async with self._connection_lock:
+                idle_for = time.monotonic() - self._last_used
+                if not self._active_operations and idle_for >= idle_timeout:
+                    if self._is_connected():
+                        await self._send_archive_batch()
+                        await self.client.disconnect()
+                        if settings.DEBUG_LOGGING:
+                            logger.debug(f"{self.session_name} | Telegram connection closed after {int(idle_for)}s idle")
+                    return
+            await asyncio.sleep(max(idle_timeout - idle_for, 1))
+
+    async def close(self) -> None:
+        """Archives channels still waiting in the batch and closes a connection left open by persistent mode."""
+        if self._archive_flush_task is not None:
+            self._archive_flush_task.cancel()
+            self._archive_flush_task = None
+        await self._flush_archive_batch()
+        if self._idle_disconnect_task is not None:
+            self._idle_disconnect_task.cancel()
+            self._idle_disconnect_task = None
+        async with self._connection_lock:
+            if self._active_operations == 0 and self._is_connected():
+                await self.client.disconnect()
+        if self._peer_repository is not None:
+            await self._peer_repository.close()
+            self._peer_repository = None
+            self._peer_repository_ready = False
+
+    async def _get_peer_repository(self) -> ChannelRepository:
+        if self._peer_repository is None:
+            self._peer_repository = ChannelRepository()
+        if not self._peer_repository_ready:
+            await self._peer_repository.initialize()
+            self._peer_repository_ready = True
+        return self._peer_repository
+
+    async def _resolve_channel_peer(self, username: str):
+        """Returns the raw InputPeerChannel for username, resolving it over the network only on a cache miss."""
+        key = username.lower()
+        cached = self._peer_cache.get(key)
+        if cached is None:
+            repository = await self._get_peer_repository()
+            cached = await repository.get_cached_peer(self.session_name, key)
+            if cached is None:
+                if self.is_pyrogram:
+                    peer = await self.client.resolve_peer(f'@{username}')
+                else:
+                    peer = await self.client.get_input_entity(f'@{username}')
+                if not hasattr(peer, 'channel_id'):
+                    raise ValueError(f"@{username} is not a channel")
+                cached = (peer.channel_id, peer.access_hash)
+                await repository.save_cached_peer(self.session_name, key, *cached)
+            self._peer_cache[key] = cached
+
+        channel_id, access_hash = cached
+        peer_type = ptypes.InputPeerChannel if self.is_pyrogram else raw.InputPeerChannel
+        return peer_type(channel_id=channel_id, access_hash=access_hash)
+
+    async def _forget_channel_peer(self, username: str) -> None:
+        self._peer_cache.pop(username.lower(), None)
+        repository = await self._get_peer_repository()
+        await repository.remove_cached_peer(self.session_name, username)
+
+    async def _call_with_channel_peer(self, username: str, action: Callable[[object], Awaitable[None]]):
+        """Runs action with the channel's peer and returns the peer.
+
+        If the cached peer turned out to be stale, resolves the username again and retries once.
+        """
+        peer = await self._resolve_channel_peer(username)
+        try:
+            await action(peer)
+        except _STALE_PEER_ERRORS:
+            await self._forget_channel_peer(username)
+            peer = await self._resolve_channel_peer(username)
+            await action(peer)
+        return peer
+
+    def _input_channel(self, peer):
+        channel_type = ptypes.InputChannel if self.is_pyrogram else raw.InputChannel
+        return channel_type(channel_id=peer.channel_id, access_hash=peer.access_hash)
+
+    async def _join_channel_peer(self, peer) -> None:
+        if self.is_pyrogram:
+            await self.client.invoke(pchannels.JoinChannel(channel=self._input_channel(peer)))
+        else:
+            await self.client(channels.JoinChannelRequest(channel=self._input_channel(peer)))
+
+    async def _leave_channel_peer(self, peer) -> None:
+        if self.is_pyrogram:
+            await self.client.invoke(pchannels.LeaveChannel(channel=self._input_channel(peer)))
+        else:
+            await self.client(channels.LeaveChannelRequest(channel=self._input_channel(peer)))
+
     async def get_app_webview_url(self, bot_username: str, bot_shortname: str, default_val: str) -> str:
         self.is_first_run = await first_run.check_is_first_run(self.session_name)
         return await self._pyrogram_get_app_webview_url(bot_username, bot_shortname, default_val) if self.is_pyrogram \
@@ -108,8 +262,7 @@ class UniversalTelegramClient:
 
         async with self.lock:
             try:
-                if not self.client.is_connected():
-                    await self.client.connect()
+                await self._acquire_connection()
                 await self._telethon_initialize_webview_data(bot_username=bot_username, bot_shortname=bot_shortname)
                 await asyncio.sleep(uniform(1, 2))
 
@@ -141,9 +294,7 @@ class UniversalTelegramClient:
                 raise
 
             finally:
-                if self.client.is_connected():
-                    await self.client.disconnect()
-                    await asyncio.sleep(15)
+                await self._release_connection(pause=15)
 
     async def _telethon_get_webview_url(self, bot_username: str, bot_url: str, default_val: str) -> str:
         if self.proxy and not self.client._proxy:
@@ -152,8 +303,7 @@ class UniversalTelegramClient:
 
         async with self.lock:
             try:
-                if not self.client.is_connected():
-                    await self.client.connect()
+                await self._acquire_connection()
                 await self._telethon_initialize_webview_data(bot_username=bot_username)
                 await asyncio.sleep(uniform(1, 2))
 
@@ -188,9 +338,7 @@ class UniversalTelegramClient:
                 raise
 
             finally:
-                if self.client.is_connected():
-                    await self.client.disconnect()
-                    await asyncio.sleep(15)
+                await self._release_connection(pause=15)
 
     async def _pyrogram_initialize_webview_data(self, bot_username: str, bot_shortname: str = None):
         if not self._webview_data:
@@ -212,8 +360,7 @@ class UniversalTelegramClient:
 
         async with self.lock:
             try:
-                if not self.client.is_connected:
-                    await self.client.connect()
+                await self._acquire_connection()
                 await self._pyrogram_initialize_webview_data(bot_username, bot_shortname)
                 await asyncio.sleep(uniform(1, 2))
 
@@ -245,9 +392,7 @@ class UniversalTelegramClient:
                 raise
 
             finally:
-                if self.client.is_connected:
-                    await self.client.disconnect()
-                    await asyncio.sleep(15)
+                await self._release_connection(pause=15)
 
     async def _pyrogram_get_webview_url(self, bot_username: str, bot_url: str, default_val: str) -> str:
         if self.proxy and not self.client.proxy:
@@ -256,8 +401,7 @@ class UniversalTelegramClient:
 
         async with self.lock:
             try:
-                if not self.client.is_connected:
-                    await self.client.connect()
+                await self._acquire_connection()
                 await self._pyrogram_initialize_webview_data(bot_username)
                 await asyncio.sleep(uniform(1, 2))
 
@@ -293,9 +437,7 @@ class UniversalTelegramClient:
                 raise
 
             finally:
-                if self.client.is_connected:
-                    await self.client.disconnect()
-                    await asyncio.sleep(15)
+                await self._release_connection(pause=15)
 
     async def _telethon_join_and_mute_tg_channel(self, link: str):
         path = link.replace("https://t.me/", "")
@@ -441,32 +583,22 @@ class UniversalTelegramClient:
             
         channel_username = channel_username.replace("@", "")
         
-        was_connected = self.client.is_connected if not self.is_pyrogram else self.client.is_connected
-        
         try:
             if settings.DEBUG_LOGGING:
                 logger.debug(f"{self.session_name} | Subscribing to channel <y>{channel_username}</y>")
             
-            if not was_connected:
-                await self.client.connect()
+            await self._acquire_connection()
                 
             try:
-                if self.is_pyrogram:
-                    try:
-                        await self.client.join_chat(channel_username)
-                        chat = await self.client.get_chat(channel_username)
-                        await self._pyrogram_mute_and_archive_channel(chat.id)
-                    except UserAlreadyParticipant:
-                        logger.info(f"{self.session_name} | Already subscribed to channel <y>{channel_username}</y>")
-                    return True
-                else:
-                    try:
-                        await self.client.join_chat(channel_username)
-                        chat = await self.client.get_chat(channel_username)
-                        await self._telethon_mute_and_archive_channel(chat.id)
-                    except UserAlreadyParticipant:
-                        logger.info(f"{self.session_name} | Already subscribed to channel <y>{channel_username}</y>")
-                    return True
+                try:
+                    peer = await self._call_with_channel_peer(channel_username, self._join_channel_peer)
+                    if self.is_pyrogram:
+                        await self._pyrogram_mute_and_archive_channel(peer)
+                    else:
+                        await self._telethon_mute_and_archive_channel(peer)
+                except (UserAlreadyParticipant, UserAlreadyParticipantError):
+                    logger.info(f"{self.session_name} | Already subscribed to channel <y>{channel_username}</y>")
+                return True
                     
             except FloodWait as e:
                 wait_time = e.value if self.is_pyrogram else e.seconds
@@ -474,7 +606,8 @@ class UniversalTelegramClient:
                 await asyncio.sleep(wait_time + uniform(1, 3))
                 return await self.join_telegram_channel(channel_data)
                 
-            except (UserBannedInChannel, UsernameNotOccupied, UsernameInvalid) as e:
+            except (UserBannedInChannel, UsernameNotOccupied, UsernameInvalid,
+                    UserBannedInChannelError, UsernameNotOccupiedError, UsernameInvalidError) as e:
                 logger.error(f"{self.session_name} | Error while subscribing: {str(e)}")
                 return False
                 
@@ -483,17 +616,16 @@ class UniversalTelegramClient:
                 return False
                 
         finally:
-            if not was_connected and (self.client.is_connected if not self.is_pyrogram else self.client.is_connected):
-                await self.client.disconnect()
+            await self._release_connection()
                 
         await asyncio.sleep(settings.CHANNEL_SUBSCRIBE_DELAY)
         return False
 
-    async def _telethon_mute_and_archive_channel(self, channel_id: int) -> None:
+    async def _telethon_mute_and_archive_channel(self, peer: raw.InputPeerChannel) -> None:
         try:
             await self.client(account.UpdateNotifySettingsRequest(
                 peer=InputNotifyPeer(
-                    peer=await self.client.get_input_entity(channel_id)
+                    peer=peer
                 ),
                 settings=InputPeerNotifySettings(
                     mute_until=2147483647
@@ -502,24 +634,13 @@ class UniversalTelegramClient:
             if settings.DEBUG_LOGGING:
                 logger.debug(f"{self.session_name} | Notifications disabled")
             
-            await self.client(folders.EditPeerFolders(
-                folder_peers=[
-                    raw.InputFolderPeer(
-                        peer=await self.client.get_input_entity(channel_id),
-                        folder_id=1
-                    )
-                ]
-            ))
-            if settings.DEBUG_LOGGING:
-                logger.debug(f"{self.session_name} | Channel added to archive")
+            await self._queue_archive(peer)
             
         except Exception as e:
             logger.warning(f"{self.session_name} | Error while configuring channel: {str(e)}")
 
-    async def _pyrogram_mute_and_archive_channel(self, channel_id: int) -> None:
+    async def _pyrogram_mute_and_archive_channel(self, peer: ptypes.InputPeerChannel) -> None:
         try:
-            peer = await self.client.resolve_peer(channel_id)
-            
             await self.client.invoke(paccount.UpdateNotifySettings(
                 peer=ptypes.InputNotifyPeer(peer=peer),
                 settings=ptypes.InputPeerNotifySettings(
@@ -529,51 +650,85 @@ class UniversalTelegramClient:
             if settings.DEBUG_LOGGING:
                 logger.debug(f"{self.session_name} | Notifications disabled")
             
-            try:
-                await self.client.invoke(
-                    pfolders.EditPeerFolders(
-                        folder_peers=[
-                            ptypes.InputFolderPeer(
-                                peer=peer,
-                                folder_id=1
-                            )
-                        ]
-                    )
-                )
-                if settings.DEBUG_LOGGING:
-                    logger.debug(f"{self.session_name} | Channel added to archive")
-            except Exception as e:
-                logger.warning(f"{self.session_name} | Error while archiving: {str(e)}")
+            await self._queue_archive(peer)
                 
         except Exception as e:
             logger.warning(f"{self.session_name} | Error while configuring channel: {str(e)}")
 
+    async def _queue_archive(self, peer) -> None:
+        """Defers archiving of a joined channel so that several channels go out in one EditPeerFolders.
+
+        The batch is sent once it holds TG_ARCHIVE_BATCH_SIZE channels. Otherwise it is kept
+        across disconnects and goes out with the first connection opened TG_ARCHIVE_BATCH_WINDOW
+        seconds or more after the first channel was queued (in persistent mode by a timer over the
+        open connection), or on close().
+        """
+        if not self._pending_archive:
+            self._archive_queued_at = time.monotonic()
+        self._pending_archive[peer.channel_id] = peer
+        if len(self._pending_archive) >= settings.TG_ARCHIVE_BATCH_SIZE:
+            await self._flush_archive_batch()
+        elif self._persistent_connection and (self._archive_flush_task is None or self._archive_flush_task.done()):
+            self._archive_flush_task = asyncio.create_task(self._flush_archive_later())
+
+    async def _flush_archive_later(self) -> None:
+        await asyncio.sleep(settings.TG_ARCHIVE_BATCH_WINDOW)
+        await self._flush_archive_batch()
+
+    async def _flush_archive_batch(self) -> None:
+        if not self._pending_archive:
+            return
+        await self._acquire_connection()
+        try:
+            await self._send_archive_batch()
+        finally:
+            await self._release_connection()
+
+    def _archive_batch_due(self) -> bool:
+        return bool(self._pending_archive) and time.monotonic() - self._archive_queued_at >= settings.TG_ARCHIVE_BATCH_WINDOW
+
+    async def _send_archive_batch(self) -> None:
+        """Sends the queued channels over the current connection; the caller keeps it open."""
+        if not self._pending_archive:
+            return
+        batch, self._pending_archive = list(self._pending_archive.values()), {}
+        if self.is_pyrogram:
+            request = pfolders.EditPeerFolders(
+                folder_peers=[ptypes.InputFolderPeer(peer=peer, folder_id=1) for peer in batch]
+            )
+        else:
+            request = folders.EditPeerFoldersRequest(
+                folder_peers=[raw.InputFolderPeer(peer=peer, folder_id=1) for peer in batch]
+            )
+
+        try:
+            if self.is_pyrogram:
+                await self.client.invoke(request)
+            else:
+                await self.client(request)
+            if settings.DEBUG_LOGGING:
+                logger.debug(f"{self.session_name} | {len(batch)} channel(s) added to archive")
+        except Exception as e:
+            logger.warning(f"{self.session_name} | Error while archiving {len(batch)} channel(s): {str(e)}")
+
     async def leave_telegram_channel(self, channel_username: str) -> bool:
         """Отписывается от указанного Telegram-канала по его username."""
         if not channel_username:
             logger.error(f"{self.session_name} | No channel username provided for leaving.")
             return False
 
-        was_connected = self.client.is_connected if not self.is_pyrogram else self.client.is_connected
-
         try:
             if settings.DEBUG_LOGGING:
                 logger.debug(f"{self.session_name} | Attempting to leave channel <y>{channel_username}</y>")
 
-            if not was_connected:
-                await self.client.connect()
+            await self._acquire_connection()
 
             try:
-                if self.is_pyrogram:
-                    await self.client.leave_chat(channel_username)
-                    logger.info(f"{self.session_name} | Successfully left channel <y>{channel_username}</y> (Pyrogram).")
-                    return True
-                else:
-                    # Для Telethon нужно получить сущность канала
-                    entity = await self.client.get_entity(f'@{channel_username}')
-                    await self.client(channels.LeaveChannelRequest(channel=entity))
-                    logger.info(f"{self.session_name} | Successfully left channel <y>{channel_username}</y> (Telethon).")
-                    return True
+                peer = await self._call_with_channel_peer(channel_username, self._leave_channel_peer)
+                # Archiving a channel we already left would fail the whole batch
+                self._pending_archive.pop(peer.channel_id, None)
+                logger.info(f"{self.session_name} | Successfully left channel <y>{channel_username}</y>.")
+                return True
 
             except (ChannelPrivateError, ChannelInvalidError, UsernameNotOccupied, UsernameInvalid, UserNotParticipant, UserNotParticipantError) as e:
                 logger.warning(f"{self.session_name} | Cannot leave channel <y>{channel_username}</y> (user not participant or channel issue): {str(e)}")
@@ -593,9 +748,6 @@ class UniversalTelegramClient:
                 return False
 
         finally:
-            if not was_connected and (self.client.is_connected if not self.is_pyrogram else self.client.is_connected):
-                 # Отключаемся только если мы сами подключались
-                 await self.client.disconnect()
-                 await asyncio.sleep(uniform(1, 3))
+            await self._release_connection(pause=uniform(1, 3))
 
         return False # Добавлено на случай, если ни один return не сработает (хотя такого быть не должно)
@@ -1,106 +1,123 @@
 import os
 import sys
 import asyncio
-import subprocess
-from typing import Optional
+from typing import Tuple
 from bot.utils import logger
 from bot.config import settings
 
 class UpdateManager:
+    """Fleet-wide auto-updater: one per process, owned by the launcher.
+
+    All commands run as subprocesses off the event loop. When an update has been
+    installed, restart_requested is set; the launcher then stops the sessions
+    gracefully and calls restart().
+    """
+
     def __init__(self):
         self.branch = "main"
         self.check_interval = settings.CHECK_UPDATE_INTERVAL
         self.is_update_restart = "--update-restart" in sys.argv
-        self._configure_git_safe_directory()
+        self.restart_requested = asyncio.Event()
+
+    @staticmethod
+    async def _run_command(*args: str, capture_output: bool = True) -> Tuple[int, str, str]:
+        pipe = asyncio.subprocess.PIPE if capture_output else None
+        process = await asyncio.create_subprocess_exec(*args, stdout=pipe, stderr=pipe)
+        stdout, stderr = await process.communicate()
+        return (
+            process.returncode,
+            stdout.decode(errors="replace") if stdout else "",
+            stderr.decode(errors="replace") if stderr else "",
+        )
 
-    def _configure_git_safe_directory(self) -> None:
+    async def _configure_git_safe_directory(self) -> None:
+        current_dir = os.getcwd()
         try:
-            current_dir = os.getcwd()
-            subprocess.run(
-                ["git", "config", "--global", "--add", "safe.directory", current_dir],
-                check=True,
-                capture_output=True
+            returncode, _, stderr = await self._run_command(
+                "git", "config", "--global", "--add", "safe.directory", current_dir
             )
-            logger.info("Git safe.directory configured successfully")
-        except subprocess.CalledProcessError as e:
+        except OSError as e:
             logger.error(f"Failed to configure git safe.directory: {e}")
+            return
+        if returncode == 0:
+            logger.info("Git safe.directory configured successfully")
+        else:
+            logger.error(f"Failed to configure git safe.directory: {stderr.strip()}")
 
-    def _check_requirements_changed(self) -> bool:
-        try:
-            result = subprocess.run(
-                ["git", "diff", "--name-only", "HEAD@{1}", "HEAD"],
-                capture_output=True,
-                text=True,
-                check=True
-            )
-            changed_files = result.stdout.strip().split('\n')
-            return "requirements.txt" in changed_files
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Error checking requirements changes: {e}")
+    async def _check_requirements_changed(self) -> bool:
+        returncode, stdout, stderr = await self._run_command("git", "diff", "--name-only", "HEAD@{1}", "HEAD")
+        if returncode != 0:
+            logger.error(f"Error checking requirements changes: {stderr.strip()}")
             return True
+        changed_files = stdout.strip().split('\n')
+        return "requirements.txt" in changed_files
 
     async def check_for_updates(self) -> bool:
-        try:
-            subprocess.run(["git", "fetch"], check=True, capture_output=True)
-            result = subprocess.run(
-                ["git", "status", "-uno"],
-                capture_output=True,
-                text=True,
-                check=True
-            )
-            return "Your branch is behind" in result.stdout
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Error checking updates: {e}")
+        returncode, _, stderr = await self._run_command("git", "fetch")
+        if returncode != 0:
+            logger.error(f"Error checking updates: {stderr.strip()}")
+            return False
+        returncode, stdout, stderr = await self._run_command("git", "status", "-uno")
+        if returncode != 0:
+            logger.error(f"Error checking updates: {stderr.strip()}")
             return False
+        return "Your branch is behind" in stdout
 
-    def _pull_updates(self) -> bool:
-        try:
-            subprocess.run(["git", "pull"], check=True, capture_output=True)
-            return True
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Error updating: {e}")
-            if e.stderr:
-                logger.error(f"Git error details: {e.stderr.decode()}")
+    async def _pull_updates(self) -> bool:
+        returncode, _, stderr = await self._run_command("git", "pull")
+        if returncode != 0:
+            logger.error(f"Error updating: git pull exited with code {returncode}")
+            if stderr:
+                logger.error(f"Git error details: {stderr}")
             return False
+        return True
 
-    def _install_requirements(self) -> bool:
-        try:
-            if not self._check_requirements_changed():
-                logger.info("📦 No changes in requirements.txt, skipping dependency installation")
-                return True
-                
-            logger.info("📦 Changes detected in requirements.txt, updating dependencies...")
-            subprocess.run([sys.executable, "-m", "pip", "install", "-r", "requirements.txt"], check=True)
+    async def _install_requirements(self) -> bool:
+        if not await self._check_requirements_changed():
+            logger.info("📦 No changes in requirements.txt, skipping dependency installation")
             return True
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Error installing dependencies: {e}")
+
+        logger.info("📦 Changes detected in requirements.txt, updating dependencies...")
+        returncode, _, _ = await self._run_command(
+            sys.executable, "-m", "pip", "install", "-r", "requirements.txt", capture_output=False
+        )
+        if returncode != 0:
+            logger.error(f"Error installing dependencies: pip exited with code {returncode}")
             return False
+        return True
 
     async def update_and_restart(self) -> None:
         logger.info("🔄 Update detected! Starting update process...")
-        
-        if not self._pull_updates():
+
+        if not await self._pull_updates():
             logger.error("❌ Failed to pull updates")
             return
 
-        if not self._install_requirements():
+        if not await self._install_requirements():
             logger.error("❌ Failed to update dependencies")
             return
 
-        logger.info("✅ Update successfully installed! Restarting application...")
-        
+        logger.info("✅ Update successfully installed! Stopping sessions before restart...")
+        self.restart_requested.set()
+
+    def restart(self) -> None:
+        """Replaces the current process with a fresh one; call after sessions have been stopped."""
+        logger.info("🔄 Restarting application...")
         new_args = [sys.executable, sys.argv[0], "-a", "1", "--update-restart"]
         os.execv(sys.executable, new_args)
 
     async def run(self) -> None:
+        await self._configure_git_safe_directory()
         if not self.is_update_restart:
             await asyncio.sleep(10)
-        
+
         while True:
             try:
                 if await self.check_for_updates():
                     await self.update_and_restart()
+                    if self.restart_requested.is_set():
+                        return
                 await asyncio.sleep(self.check_interval)
             except Exception as e:
                 logger.error(f"Error during update check: {e}")
-                await asyncio.sleep(60)
\ No newline at end of file
+                await asyncio.sleep(60)
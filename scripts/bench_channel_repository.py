@@ -0,0 +1,66 @@
+"""Benchmark of ChannelRepository connection modes on a fresh channels.db.
+
+Every session checks and marks a series of giveaways the way a giveaway cycle
+does: is_giveaway_processed, is_giveaway_pending, add_pending_giveaway and
+add_processed_giveaway. Run from the repository root with the usual .env in place:
+
+    python scripts/bench_channel_repository.py --sessions 20 --giveaways 50
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.utils.channel_repository import ChannelRepository  # noqa: E402
+
+MODES = {
+    # The pre-shared-connection behaviour: a new connection and commit per call
+    'connect-per-call': dict(persistent=False),
+    'persistent': dict(persistent=True),
+}
+OPS_PER_GIVEAWAY = 4
+
+
+async def run_session(repository: ChannelRepository, session_name: str, giveaways: int) -> None:
+    for index in range(giveaways):
+        giveaway_id = f"{session_name}-{index}"
+        await repository.is_giveaway_processed(giveaway_id)
+        await repository.is_giveaway_pending(session_name, giveaway_id)
+        await repository.add_pending_giveaway(session_name, giveaway_id, {"chanels": ["channel"], "endAt": None})
+        await repository.add_processed_giveaway(giveaway_id)
+
+
+async def bench(mode: str, sessions: int, giveaways: int) -> float:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'channels.db')
+        repositories = [ChannelRepository(db_path, **MODES[mode]) for _ in range(sessions)]
+        await repositories[0].initialize()
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            run_session(repository, f"session{number}", giveaways)
+            for number, repository in enumerate(repositories)
+        ))
+        for repository in repositories:
+            await repository.close()
+        elapsed = time.perf_counter() - started
+    return sessions * giveaways * OPS_PER_GIVEAWAY / elapsed
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=20)
+    parser.add_argument('--giveaways', type=int, default=50)
+    parser.add_argument('--mode', choices=list(MODES), action='append', help='Modes to run (default: all)')
+    args = parser.parse_args()
+
+    for mode in args.mode or list(MODES):
+        ops_per_second = await bench(mode, args.sessions, args.giveaways)
+        print(f"{mode:>17}: {ops_per_second:>10,.0f} ops/s")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())